@@ -1,7 +1,11 @@
-from DesignTree.Utils import HierInstPath, dictAdd, cl
-from DesignTree.PortXml import PortXmlReader
+from DesignTree.Utils import FileStamp, HierInstPath, dictAdd, cl, diag
+from DesignTree.PortXml import PortXmlParser, PortXmlReader
 from DesignTree.Node import ModuleNode, ModuleLink
+from DesignTree.Stats import stats
 from dataclasses import dataclass
+from typing import Iterator
+from sys import intern
+import copy
 
 
 @dataclass(frozen=True)
@@ -18,17 +22,74 @@ class InstParentPath:
     def fromStr(x: str) -> "InstParentPath":
         instPath, sModule = x.split(":")
         pModule, instance = instPath.split(".")
-        return InstParentPath(pModule, instance, sModule)
+        return InstParentPath(intern(pModule), intern(instance), intern(sModule))
+
+
+@dataclass(frozen=True)
+class ModuleCount:
+    """
+    occurrences: number of absolute instances of the module, len(outer)
+    subtree: number of instances in the subtree of one instance, including itself
+    leaves: number of leaf instances in the subtree of one instance, len(inner)
+    """
+
+    occurrences: int
+    subtree: int
+    leaves: int
 
 
 class DesignTopoGraph:
     """
     Design hierarchical topological graph
+
+    self.allNodes: every module node loaded, shared by all views selected from the graph
+    self.nodes: module nodes of the view, reachable from self.roots
+    node links (prev, ports.outer) may lead out of the view, use prevOf to stay in it
     """
 
     def __init__(self) -> None:
         self.nodes = dict[str, ModuleNode]()
+        self.allNodes = self.nodes
         self.roots = set[str]()
+        # files the graph is built from, for snapshot invalidation
+        self.inputFiles = list[str]()
+        # path -> stamp taken when the file is read, xml stamps are kept by self.portXmls
+        self.readStamps = dict[str, FileStamp]()
+        # module name -> paths from roots to the module, cache of outer
+        self.__ancestors = dict[str, list[HierInstPath]]()
+        # module name -> instance counts, computed for all modules at once
+        self.__counts = dict[str, ModuleCount]()
+
+    def addInputFile(self, path: str, stamp: FileStamp | None = None):
+        """
+        record a file the graph is built from
+        stamp: of the content read, None to stamp the file when a snapshot is saved
+        """
+        self.inputFiles.append(path)
+        if stamp is not None:
+            self.readStamps[path] = stamp
+
+    def inputStamps(self) -> list[FileStamp]:
+        """
+        stamps of the input files taken when they were read,
+        so a file changed during a long build makes the snapshot stale.
+        a file not read yet is stamped now
+        """
+        stamps = dict(self.readStamps)
+        if hasattr(self, "portXmls"):
+            for stamp in self.portXmls.stamps.values():
+                stamps[stamp.path] = stamp
+        return [
+            stamps[path] if path in stamps else FileStamp.of(path)
+            for path in dict.fromkeys(self.inputFiles)
+        ]
+
+    def invalidateCache(self):
+        """
+        must be called after the module hierarchy is changed
+        """
+        self.__ancestors.clear()
+        self.__counts.clear()
 
     def createModuleHier(
         self, blockClassNameList: list[str], instParentPaths: list[InstParentPath]
@@ -42,8 +103,10 @@ class DesignTopoGraph:
             if p.container not in self.nodes:
                 dictAdd(self.nodes, p.container, ModuleNode(p.container))
                 self.roots.add(p.container)
-                cl.warning(
-                    f"logical/tile_info.xml Container List not cover instance parent path: {p.container}"
+                diag.warn(
+                    "uncoveredContainer",
+                    "logical/tile_info.xml Container List not cover instance parent path: %s",
+                    p.container,
                 )
 
             pModuleNode = self.nodes[p.container]
@@ -57,37 +120,72 @@ class DesignTopoGraph:
             if p.subModule in self.roots:
                 self.roots.remove(p.subModule)
 
+        self.invalidateCache()
+
+    def addInstance(self, pNode: ModuleNode, instance: str, subModule: str):
+        """
+        instantiate subModule in pNode with name instance,
+        the sub module node is created if not exist
+        """
+        sNode = self.allNodes.setdefault(subModule, ModuleNode(subModule))
+        self.nodes[subModule] = sNode
+        pNode.next[instance] = sNode
+        sNode.prev[ModuleLink(pNode.name, instance)] = pNode
+        self.invalidateCache()
+        return sNode
+
     def tops(self, modules: set[str]):
         """
-        return a set of successfully selected top module
-        还需要加入修建分支的功能，否则会导致多余的连接
+        select modules reachable from modules as the view of self,
+        return a set of successfully selected top module.
+        nodes out of the view are kept in self.allNodes, tops can be called again
         """
-        moduleSet = dict[str, ModuleNode]()
+        reachable = dict[str, ModuleNode]()
         success = set[str]()
         for top in modules:
-            topNode = self.nodes.get(top)
+            topNode = self.allNodes.get(top)
             if topNode is None:
                 continue
             success.add(top)
-            queue = list[ModuleNode]()
-            queue.append(topNode)
-            while queue.__len__() > 0:
-                currNode = queue.pop()
-                moduleSet[currNode.name] = currNode
+            # each module is expanded once, however many times it is instantiated
+            stack = [topNode]
+            while stack.__len__() > 0:
+                currNode = stack.pop()
+                if currNode.name in reachable:
+                    continue
+                reachable[currNode.name] = currNode
                 for nextModule in currNode.next.values():
-                    queue.append(self.nodes[nextModule.name])
-
-        removedNodes = self.nodes.keys() - moduleSet.keys()
-        for removed in removedNodes:
-            for subInstance, subNode in self.nodes[removed].next.items():
-                subNode.prev.pop(ModuleLink(removed, subInstance))
-            for link, pNode in self.nodes[removed].prev.items():
-                pNode.next.pop(link.instance)
+                    if nextModule.name not in reachable:
+                        stack.append(nextModule)
 
         self.roots = success
-        self.nodes = moduleSet
+        self.nodes = reachable
+        self.invalidateCache()
         return success
 
+    def select(self, modules: set[str]):
+        """
+        a new view of modules reachable from modules, sharing module and port nodes with self,
+        view.roots is the set of successfully selected top module
+        """
+        view = copy.copy(self)
+        view.inputFiles = list(self.inputFiles)
+        view.readStamps = dict(self.readStamps)
+        view.__ancestors = dict[str, list[HierInstPath]]()
+        view.__counts = dict[str, ModuleCount]()
+        view.tops(modules)
+        return view
+
+    def prevOf(self, node: ModuleNode) -> list[tuple[ModuleLink, ModuleNode]]:
+        """
+        instantiations of node by modules in the view
+        """
+        return [
+            (link, pNode)
+            for link, pNode in node.prev.items()
+            if self.nodes.get(pNode.name) is pNode
+        ]
+
     def isLeaf(self, moduleName: str) -> bool:
         node = self.nodes.get(moduleName)
         if node is not None:
@@ -107,7 +205,7 @@ class DesignTopoGraph:
         return set(map(lambda x: x.name, leafNodes))
 
     def moduleName(self, instPath: HierInstPath) -> str | None:
-        if instPath.instances.__len__() == 0:
+        if instPath.depth() == 0:
             assert instPath.module in self.nodes
             return instPath.module
 
@@ -121,7 +219,7 @@ class DesignTopoGraph:
         return node.name
 
     def moduleNode(self, instPath: HierInstPath) -> ModuleNode | None:
-        if instPath.instances.__len__() == 0:
+        if instPath.depth() == 0:
             assert instPath.module in self.nodes
             return self.nodes[instPath.module]
 
@@ -134,49 +232,232 @@ class DesignTopoGraph:
             return None
         return node
 
-    def outer(self, instPath: HierInstPath):
-        if instPath.module in self.roots:
-            return [instPath]
-        # instPath is not from root
-        res: list[HierInstPath] = []
-        for moduleLink, pNode in self.nodes[instPath.module].prev.items():
-            pInstPath = HierInstPath(
-                pNode.name, (moduleLink.instance,) + instPath.instances
-            )
-            subList = self.outer(pInstPath)
-            res.extend(subList)
-        return res
+    def __ancestorsOf(self, module: str) -> list[HierInstPath]:
+        """
+        paths from roots to module, computed iteratively and cached per module
+        """
+        cached = self.__ancestors.get(module)
+        if cached is not None:
+            return cached
+        expanded = set[str]()
+        stack = [module]
+        while stack.__len__() > 0:
+            name = stack[-1]
+            if name in self.__ancestors:
+                stack.pop()
+                continue
+            if name in self.roots:
+                self.__ancestors[name] = [HierInstPath(name, ())]
+                stack.pop()
+                continue
+            prev = self.prevOf(self.nodes[name])
+            pending = [p.name for _, p in prev if p.name not in self.__ancestors]
+            if pending.__len__() > 0:
+                assert name not in expanded, f"module {name} instantiates itself"
+                expanded.add(name)
+                stack.extend(pending)
+                continue
+            res: list[HierInstPath] = []
+            for moduleLink, pNode in prev:
+                for pPath in self.__ancestors[pNode.name]:
+                    res.append(pPath.addInst(moduleLink.instance))
+            self.__ancestors[name] = res
+            stack.pop()
+        return self.__ancestors[module]
+
+    def __topoOrder(self) -> list[ModuleNode]:
+        """
+        module nodes of the view, every module before its sub modules
+        """
+        postOrder = list[ModuleNode]()
+        done = set[str]()
+        for root in self.roots:
+            stack = [(self.nodes[root], False)]
+            while stack.__len__() > 0:
+                node, expanded = stack.pop()
+                if expanded:
+                    postOrder.append(node)
+                    continue
+                if node.name in done:
+                    continue
+                done.add(node.name)
+                stack.append((node, True))
+                for sub in node.next.values():
+                    if sub.name not in done:
+                        stack.append((sub, False))
+        postOrder.reverse()
+        return postOrder
+
+    def countOf(self, module: str) -> ModuleCount:
+        """
+        instance counts of module, all modules are counted in one pass over the hierarchy,
+        check them before expanding outer or inner of a module
+        """
+        if self.__counts.__len__() == 0:
+            order = self.__topoOrder()
+            occurrences = {node.name: 0 for node in order}
+            for root in self.roots:
+                occurrences[root] = 1
+            for node in order:
+                for sub in node.next.values():
+                    # a selected top is not expanded by its parents, as outer
+                    if sub.name not in self.roots:
+                        occurrences[sub.name] += occurrences[node.name]
+            for node in reversed(order):
+                subtree, leaves = 1, 1 if node.isLeaf() else 0
+                for sub in node.next.values():
+                    subCount = self.__counts[sub.name]
+                    subtree = subtree + subCount.subtree
+                    leaves = leaves + subCount.leaves
+                self.__counts[node.name] = ModuleCount(
+                    occurrences[node.name], subtree, leaves
+                )
+        return self.__counts[module]
+
+    def countOuter(self, instPath: HierInstPath) -> int:
+        """
+        len(self.outer(instPath)), without expanding it
+        """
+        return self.countOf(instPath.module).occurrences
 
-    def inner(self, instPath: HierInstPath) -> list[HierInstPath]:
+    def countInner(self, instPath: HierInstPath) -> int:
+        """
+        len(self.inner(instPath)), without expanding it
+        """
         moduleName = self.moduleName(instPath)
         assert moduleName is not None
-        if self.isLeaf(moduleName):
-            return [instPath]
-        # instPath is not leaf
-        res: list[HierInstPath] = []
-        for sInst, sNode in self.nodes[instPath.module].next.items():
-            sInstPath = HierInstPath(sNode.name, instPath.instances + (sInst,))
-            subList = self.inner(sInstPath)
-            res.extend(subList)
-        return res
+        return self.countOf(moduleName).leaves
 
-    def createPortTopo(self, xmlDir: str):
-        self.portXmls = PortXmlReader(xmlDir, self.containers())
-        for module, node in self.nodes.items():
+    def iterOuter(self, instPath: HierInstPath) -> Iterator[HierInstPath]:
+        """
+        absolute paths from roots of instPath
+        """
+        for pPath in self.__ancestorsOf(instPath.module):
+            yield pPath.concat(instPath)
+
+    def outer(self, instPath: HierInstPath, limit: int | None = None) -> list[HierInstPath]:
+        """
+        limit: raise instead of expanding more than limit paths
+        """
+        if limit is not None:
+            count = self.countOuter(instPath)
+            if count > limit:
+                cl.error("outer of %s has %d paths, more than %d", instPath, count, limit)
+        return list(self.iterOuter(instPath))
+
+    def iterInner(self, instPath: HierInstPath) -> Iterator[HierInstPath]:
+        """
+        paths of leaf instances under instPath
+        """
+        node = self.moduleNode(instPath)
+        assert node is not None
+        stack = [(instPath, node)]
+        while stack.__len__() > 0:
+            path, node = stack.pop()
             if node.isLeaf():
+                yield path
                 continue
-            modulePortXml = self.portXmls.load(module, "port")
-            assert modulePortXml is not None
-            node.loadPortXml(modulePortXml)
-            moduleLocalConnect = self.portXmls.load(module, "local_connect")
-            assert moduleLocalConnect is not None
-            node.loadLocalConnec(moduleLocalConnect)
+            for sInst, sNode in reversed(node.next.items()):
+                stack.append((path.addInst(sInst), sNode))
+
+    def inner(self, instPath: HierInstPath, limit: int | None = None) -> list[HierInstPath]:
+        """
+        limit: raise instead of expanding more than limit paths
+        """
+        if limit is not None:
+            count = self.countInner(instPath)
+            if count > limit:
+                cl.error("inner of %s has %d paths, more than %d", instPath, count, limit)
+        return list(self.iterInner(instPath))
+
+    def createPortTopo(
+        self, xmlDir: str, stream: bool = False, workers: int = 1, lazy: bool = False
+    ):
+        """
+        load port.xml and local_connect.xml of all containers
+        stream: use streaming xml parser, for huge xml files
+        workers: number of processes parsing xml, the graph is the same as workers=1
+        lazy: load the xml of a container when its ports are first queried,
+        by ModuleNode.portOf/localOf or PortWireNode.leaves
+        """
+        self.portXmls = PortXmlReader(xmlDir, self.containers(), stream)
+        containers = [module for module, node in self.nodes.items() if not node.isLeaf()]
+        for module in containers:
+            self.inputFiles.append(self.portXmls.xmlFile(module, "port"))
+            self.inputFiles.append(self.portXmls.xmlFile(module, "local_connect"))
+            node = self.nodes[module]
+            # a node shared with another view may be loaded or pending already
+            if not node.loaded and node.loader is None:
+                node.loader = self.__loadContainer
+        if not lazy:
+            self.loadPortTopo(workers)
+
+    def __loadContainer(self, node: ModuleNode):
+        portXml = self.portXmls.load(node.name, "port")
+        localConnect = self.portXmls.load(node.name, "local_connect")
+        assert portXml is not None and localConnect is not None
+        self.__linkContainer(node, portXml, localConnect)
+
+    def __linkContainer(
+        self, node: ModuleNode, portXml: PortXmlParser, localConnect: PortXmlParser
+    ):
+        with stats.stage("linkContainer") as record:
+            start = stats.clock()
+            node.loadPortXml(portXml)
+            node.loadLocalConnec(localConnect)
+            node.loaded = True
+            wires = portXml.wireDict.__len__() + localConnect.wireDict.__len__()
+            record.items = record.items + wires
+            stats.container(node.name, start, wires)
+
+    def loadPortTopo(self, workers: int = 1):
+        """
+        load the containers not loaded yet in lazy mode,
+        must be called before walking ports of the whole graph directly
+        """
+        pending = [module for module, node in self.nodes.items() if node.loader is not None]
+        if pending.__len__() == 0:
+            return
+        for module in pending:
+            self.nodes[module].loader = None
+        with stats.stage("loadPortTopo") as record:
+            for module, modulePortXml, moduleLocalConnect in self.portXmls.loadAll(
+                pending, workers
+            ):
+                self.__linkContainer(self.nodes[module], modulePortXml, moduleLocalConnect)
+            record.items = record.items + pending.__len__()
+
+    def reloadPortTopo(self, workers: int = 1) -> set[str]:
+        """
+        reload port.xml and local_connect.xml of containers whose xml files are changed
+        since createPortTopo or the last reload, the other containers are untouched.
+        return the reloaded containers
+
+        queries built on the port topology (LeafPortQuery, NetIndex...) should be rebuilt
+        """
+        # a graph loaded from snapshot has no xml reader, load the snapshot again instead
+        assert hasattr(self, "portXmls"), "port topology is not created by createPortTopo"
+        changed = self.portXmls.changed()
+        # unload all before loading, links between two changed containers are rebuilt once
+        unloaded = dict[str, ModuleNode]()
+        for module in changed:
+            for node in self.nodes[module].unloadPortTopo():
+                unloaded[node.name] = node
+            self.portXmls.drop(module)
+        # after all unloads, a port of a changed sub container is unlinked by its parent too
+        for node in unloaded.values():
+            node.dropUnlinkedPorts()
+        for module, modulePortXml, moduleLocalConnect in self.portXmls.loadAll(
+            sorted(changed), workers
+        ):
+            self.__linkContainer(self.nodes[module], modulePortXml, moduleLocalConnect)
+        return changed
 
     def instPathAdd(
         self, left: HierInstPath, right: HierInstPath
     ) -> HierInstPath | None:
         if self.moduleName(left) == right.module:
-            return HierInstPath(left.module, left.instances + right.instances)
+            return left.concat(right)
         else:
             return None
 
@@ -194,3 +475,42 @@ class DesignTopoGraph:
         if subModuleName is None:
             return None
         return HierInstPath(subModuleName, left.instances[right.instances.__len__() :])
+
+
+class PathResolver:
+    """
+    resolve dotted absolute path strings ("chip.top.u0.u1") of a graph view
+    to (instance path from top, module node or None if not exist)
+
+    components before the first topName are dropped, as LogicalTileMap.pathStr2HierInstPath.
+    parent paths are resolved once and shared by all paths under them,
+    so resolving many paths walks each common prefix only once
+    """
+
+    def __init__(self, graph: DesignTopoGraph, topName: str) -> None:
+        self.graph = graph
+        self.topName = topName
+        # parent path string -> resolved, None if top is not in the path
+        self.prefixes = dict[str, tuple[HierInstPath, ModuleNode | None] | None]()
+
+    def resolve(self, pathStr: str) -> tuple[HierInstPath, ModuleNode | None] | None:
+        """
+        None if topName is not a component of pathStr
+        """
+        parentStr, _, name = pathStr.rpartition(".")
+        parent = None if parentStr == "" else self.__prefix(parentStr)
+        if parent is None:
+            if name != self.topName:
+                return None
+            return (HierInstPath(self.topName, ()), self.graph.nodes.get(self.topName))
+        parentPath, parentNode = parent
+        node = None if parentNode is None else parentNode.next.get(name)
+        return (parentPath.addInst(intern(name)), node)
+
+    def __prefix(self, parentStr: str) -> tuple[HierInstPath, ModuleNode | None] | None:
+        if parentStr in self.prefixes:
+            return self.prefixes[parentStr]
+        res = self.resolve(parentStr)
+        self.prefixes[parentStr] = res
+        return res
+
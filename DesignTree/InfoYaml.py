@@ -0,0 +1,103 @@
+"""
+fast loading of the list keys used in logical_info.yml and tile_info.yml
+
+only top level keys whose value is a block sequence are used from the info files,
+scanLists reads them line by line, converts each item as it is read
+and skips the other keys without building them.
+a file not in this plain style is loaded by yaml, with the C loader if available.
+the file is stamped from the bytes read, it is not read again for its FileStamp.
+"""
+
+from .Utils import FileStamp, StampedReader, cl
+from typing import Any, Callable, Iterable
+import io
+import yaml
+
+# libyaml based loader is much faster than the pure python one
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# first characters of a scalar that is not a plain string, or a nested collection
+SPECIAL_STARTS = frozenset("[]{}&*!|>'\"%@`#,?:-+.~0123456789")
+# plain scalars resolved to bool or null by yaml
+RESERVED_SCALARS = frozenset(
+    ["y", "n", "yes", "no", "true", "false", "on", "off", "null"]
+)
+
+
+def isPlainStr(item: str) -> bool:
+    """
+    item is loaded by yaml as the same str
+    """
+    if item.__len__() == 0 or item[0] in SPECIAL_STARTS:
+        return False
+    if ": " in item or " #" in item or item.endswith(":"):
+        return False
+    return item.lower() not in RESERVED_SCALARS
+
+
+def scanLists(
+    lines: Iterable[str], converters: dict[str, Callable[[str], Any]]
+) -> dict[str, list] | None:
+    """
+    key -> converted items of each key in converters,
+    None if any key is missing or not a block sequence of plain strings
+    """
+    res = dict[str, list]()
+    current: list | None = None
+    convert: Callable[[str], Any] = str
+    for line in lines:
+        stripped = line.strip()
+        if stripped.__len__() == 0 or stripped[0] == "#":
+            continue
+        # top level key
+        if line[0] not in " \t-":
+            if stripped.startswith(("---", "...", "%")):
+                return None
+            key, sep, rest = stripped.partition(":")
+            if sep == "":
+                return None
+            if key not in converters:
+                current = None
+                continue
+            if rest.strip() != "" or key in res:
+                return None
+            current = res[key] = []
+            convert = converters[key]
+            continue
+        # value of a key not needed
+        if current is None:
+            continue
+        if not stripped.startswith("- "):
+            return None
+        item = stripped[2:].lstrip()
+        if not isPlainStr(item):
+            return None
+        current.append(convert(item))
+    if res.__len__() != converters.__len__():
+        return None
+    return res
+
+
+def loadInfoLists(
+    yamlFile: str, converters: dict[str, Callable[[str], Any]]
+) -> tuple[dict[str, list], FileStamp]:
+    """
+    return (key -> items of the list of key in yamlFile, converted by converters[key],
+    stamp of yamlFile)
+    """
+    source = StampedReader(yamlFile)
+    with io.TextIOWrapper(io.BufferedReader(source), encoding="utf-8") as file:
+        res = scanLists(file, converters)
+        stamp = source.stamp()
+    if res is not None:
+        return (res, stamp)
+    cl.info("%s is not plain block sequences, loaded by %s", yamlFile, YamlLoader.__name__)
+    source = StampedReader(yamlFile)
+    with io.TextIOWrapper(io.BufferedReader(source), encoding="utf-8") as file:
+        data = yaml.load(file, Loader=YamlLoader)
+        stamp = source.stamp()
+    res = dict[str, list]()
+    for key, convert in converters.items():
+        assert isinstance(data[key], list)
+        res[key] = [convert(x) for x in data[key]]
+    return (res, stamp)
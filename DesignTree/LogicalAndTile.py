@@ -1,8 +1,11 @@
 from .DesignTopoGraph import DesignTopoGraph
-from .DesignTopoGraph import InstParentPath, ModuleNode, ModuleLink
-from .Utils import HierInstPath, compareSet, cl
+from .DesignTopoGraph import InstParentPath, PathResolver
+from .Utils import HierInstPath, diag, instPathTable
+from .Stats import stats
+from .InfoYaml import loadInfoLists
 from dataclasses import dataclass
-import yaml
+from typing import Iterable, Iterator
+from multiprocessing import get_all_start_methods, get_context
 from pdb import set_trace
 
 
@@ -13,17 +16,23 @@ class LogicalTopoGraph(DesignTopoGraph):
 
     def __init__(self, yamlFile: str) -> None:
         super().__init__()
-        with open(yamlFile, "r", encoding="utf-8") as file:
-            data = yaml.safe_load(file)
-            assert isinstance(data["CONTAINER_CLASS_NAMES"], list)
-            containerNameList: list[str] = data["CONTAINER_CLASS_NAMES"]
-            containerNameList = [x.strip() for x in containerNameList]
-            # NOTE: logical view instParentPaths的最底层是leaf block
-            assert isinstance(data["ALL_BLOCK_INSTANCE_PARENT_PATH"], list)
-            strList: list[str] = data["ALL_BLOCK_INSTANCE_PARENT_PATH"]
-            instParentPaths = [InstParentPath.fromStr(x) for x in strList]
+        with stats.stage("logicalYaml") as record:
+            data, stamp = loadInfoLists(
+                yamlFile,
+                {
+                    "CONTAINER_CLASS_NAMES": str.strip,
+                    # NOTE: logical view instParentPaths的最底层是leaf block
+                    "ALL_BLOCK_INSTANCE_PARENT_PATH": InstParentPath.fromStr,
+                },
+            )
+            record.items = record.items + data["ALL_BLOCK_INSTANCE_PARENT_PATH"].__len__()
+        self.addInputFile(yamlFile, stamp)
+        containerNameList: list[str] = data["CONTAINER_CLASS_NAMES"]
+        instParentPaths: list[InstParentPath] = data["ALL_BLOCK_INSTANCE_PARENT_PATH"]
 
+        with stats.stage("logicalHier") as record:
             self.createModuleHier(containerNameList, instParentPaths)
+            record.items = record.items + self.allNodes.__len__()
 
 
 class TileTopoGraph(DesignTopoGraph):
@@ -33,22 +42,29 @@ class TileTopoGraph(DesignTopoGraph):
 
     def __init__(self, yamlFile: str) -> None:
         super().__init__()
-        blockClassNameList = list[str]()
-        instParentPaths = list[InstParentPath]()
-        with open(yamlFile, "r", encoding="utf-8") as file:
-            data = yaml.safe_load(file)
-            assert isinstance(data["ALL_AUTOGEN_BLOCK_CLASS_NAMES"], list)
-            blockClassNameList: list[str] = data["ALL_AUTOGEN_BLOCK_CLASS_NAMES"]
-            blockClassNameList = [x.strip() for x in blockClassNameList]
-            # NOTE: tile view instParentPaths的最底层是tile, 不是leaf block
-            assert isinstance(data["ALL_AUTOGEN_BLOCK_INSTANCE_PARENT_PATH"], list)
-            strList: list[str] = data["ALL_AUTOGEN_BLOCK_INSTANCE_PARENT_PATH"]
-            instParentPaths = [InstParentPath.fromStr(x) for x in strList]
-
-            assert isinstance(data["TILE_CLASS_SUBBLOCK_NAMES"], list)
-            assert isinstance(data["CTNR_CLASS_SUBBLOCK_NAMES"], list)
-
-        self.createModuleHier(blockClassNameList, instParentPaths)
+        with stats.stage("tileYaml") as record:
+            data, stamp = loadInfoLists(
+                yamlFile,
+                {
+                    "ALL_AUTOGEN_BLOCK_CLASS_NAMES": str.strip,
+                    # NOTE: tile view instParentPaths的最底层是tile, 不是leaf block
+                    "ALL_AUTOGEN_BLOCK_INSTANCE_PARENT_PATH": InstParentPath.fromStr,
+                    "TILE_CLASS_SUBBLOCK_NAMES": str,
+                    "CTNR_CLASS_SUBBLOCK_NAMES": str,
+                },
+            )
+            record.items = (
+                record.items + data["ALL_AUTOGEN_BLOCK_INSTANCE_PARENT_PATH"].__len__()
+            )
+        self.addInputFile(yamlFile, stamp)
+        blockClassNameList: list[str] = data["ALL_AUTOGEN_BLOCK_CLASS_NAMES"]
+        instParentPaths: list[InstParentPath] = data[
+            "ALL_AUTOGEN_BLOCK_INSTANCE_PARENT_PATH"
+        ]
+
+        with stats.stage("tileHier") as record:
+            self.createModuleHier(blockClassNameList, instParentPaths)
+            record.items = record.items + self.allNodes.__len__()
 
         # container class sub block info is included in all auto gen block instance parent path
         for subInstStr in data["CTNR_CLASS_SUBBLOCK_NAMES"]:
@@ -110,6 +126,39 @@ class ModulesKey:
     tile: str
 
 
+@dataclass(frozen=True)
+class MapMismatch:
+    """
+    instances of a module in one view are not the same as its map lines
+
+    view: "logical" or "tile"
+    unmapped: absolute instances of the module without map line
+    unknown: paths in map lines which are not instances of the module
+    """
+
+    key: ModulesKey
+    view: str
+    unmapped: tuple[HierInstPath, ...]
+    unknown: tuple[HierInstPath, ...]
+
+
+# hint of bytes of map file lines read at once
+MAP_BLOCK_SIZE = 1 << 24
+
+# LogicalTileMap checked by worker processes, inherited by fork without pickling
+checkingMap: "LogicalTileMap | None" = None
+
+
+def initCheckWorker(tileMap: "LogicalTileMap"):
+    global checkingMap
+    checkingMap = tileMap
+
+
+def checkModuleWorker(key: ModulesKey) -> list[MapMismatch]:
+    assert checkingMap is not None
+    return checkingMap.checkModule(key)
+
+
 class LogicalTileMap:
     @staticmethod
     def pathStr2HierInstPath(path: str, topName: str):
@@ -126,57 +175,158 @@ class LogicalTileMap:
         prefix: str,
         lgclView: LogicalTopoGraph,
         tileView: TileTopoGraph,
+        workers: int = 1,
     ) -> None:
-        mapLines = list[MapLine]()
+        """
+        workers: number of processes checking map lines, mismatches are in self.mismatches
+        """
         self.lgclView = lgclView
         self.tileView = tileView
-        with open(mapFile, "r", encoding="utf-8") as file:
-            while 1:
-                line = file.readline()
-                if line == "":
-                    break
-                lgclPathStr, _, tilePathStr = line.strip().split(" ")
-                if (prefix not in lgclPathStr) or (prefix not in tilePathStr):
-                    continue
-                lgclPath = LogicalTileMap.pathStr2HierInstPath(lgclPathStr, prefix)
-                tilePath = LogicalTileMap.pathStr2HierInstPath(tilePathStr, prefix)
-                mapLine = MapLine(lgclPath, tilePath)
-                mapLines.append(mapLine)
+        self.prefix = prefix
+        self.lgclResolver = PathResolver(lgclView, prefix)
+        self.tileResolver = PathResolver(tileView, prefix)
         # (logical module name, tile module name) -> list[inst path map line]
         self.moduleMap = dict[ModulesKey, set[MapLine]]()
-        self.__processMapLine(mapLines)
-        self.__checkMapLine()
-
-    def __processMapLine(self, mapLines: list[MapLine]):
-        for mapLine in mapLines:
-            lgclModuleName = self.lgclView.moduleName(mapLine.lgclAbsInstPath())
-            if lgclModuleName is None:
-                cl.warning(f"logical inst path {mapLine.lgcl} in map line is not exist")
+        # trie node of instance path from top -> path in the other view, of map lines
+        self.lgclIndex = dict[int, HierInstPath]()
+        self.tileIndex = dict[int, HierInstPath]()
+        with stats.stage("mapLines") as record, open(mapFile, "r", encoding="utf-8") as file:
+            while True:
+                lines = file.readlines(MAP_BLOCK_SIZE)
+                if lines.__len__() == 0:
+                    break
+                self.__processMapLine(lines)
+                record.items = record.items + lines.__len__()
+        with stats.stage("checkMapLine") as record:
+            self.mismatches = self.__checkMapLine(workers)
+            record.items = record.items + self.moduleMap.__len__()
+
+    def __processMapLine(self, lines: list[str]):
+        prefix = self.prefix
+        for line in lines:
+            lgclPathStr, _, tilePathStr = line.strip().split(" ")
+            if (prefix not in lgclPathStr) or (prefix not in tilePathStr):
                 continue
-            tileModuleName = self.tileView.moduleName(mapLine.tileAbsInstPath())
-            if tileModuleName is None:  # tileModule is a leaf block
-                tileAbsInstPath = mapLine.tileAbsInstPath()
-                pModuleNodeInTile = self.tileView.moduleNode(tileAbsInstPath.parent())
-                leafInstName = tileAbsInstPath.leaf()
-                assert pModuleNodeInTile is not None
-                # create new leaf module node
-                leafModuleNodeInTile = self.tileView.nodes.setdefault(
-                    lgclModuleName, ModuleNode(lgclModuleName)
+            lgcl = self.lgclResolver.resolve(lgclPathStr)
+            tile = self.tileResolver.resolve(tilePathStr)
+            assert lgcl is not None and tile is not None
+            (lgclPath, lgclNode), (tilePath, tileNode) = lgcl, tile
+            mapLine = MapLine(lgclPath, tilePath)
+            if lgclNode is None:
+                diag.warn(
+                    "mapLineNoPath", "logical inst path %s in map line is not exist", mapLine.lgcl
                 )
-                # link module
-                pModuleNodeInTile.next[leafInstName] = leafModuleNodeInTile
-                moduleLink = ModuleLink(pModuleNodeInTile.name, leafInstName)
-                leafModuleNodeInTile.prev[moduleLink] = pModuleNodeInTile
+                continue
+            lgclModuleName = lgclNode.name
+            if tileNode is None:  # tileModule is a leaf block
+                parent = self.tileResolver.resolve(tilePathStr.rpartition(".")[0])
+                assert parent is not None
+                pModuleNodeInTile = parent[1]
+                leafInstName = tilePath.leaf()
+                assert pModuleNodeInTile is not None
+                # create new leaf module node and link module
+                self.tileView.addInstance(pModuleNodeInTile, leafInstName, lgclModuleName)
                 # assign tile module name for later map
                 tileModuleName = lgclModuleName
+            else:
+                tileModuleName = tileNode.name
             if tileModuleName == lgclModuleName:
                 key = ModulesKey(lgclModuleName, tileModuleName)
                 mapLineSet = self.moduleMap.setdefault(key, set[MapLine]())
                 mapLineSet.add(mapLine)
+                self.lgclIndex.setdefault(lgclPath.node, tilePath)
+                self.tileIndex.setdefault(tilePath.node, lgclPath)
             else:
-                cl.warning(f"skip mapLine {mapLine} for module name not same")
+                diag.warn("mapLineModule", "skip mapLine %s for module name not same", mapLine)
 
-    def __checkMapLine(self):
+    def __translate(
+        self, index: dict[int, HierInstPath], path: HierInstPath
+    ) -> HierInstPath | None:
+        """
+        map the deepest mapped parent of path, the instances under it are the same
+        """
+        if path.module != self.prefix:
+            return None
+        node = path.node
+        while node not in index:
+            if node == 0:
+                return None
+            node = instPathTable.parents[node]
+        res = index[node]
+        for name in path.instances[instPathTable.depths[node] :]:
+            res = res.addInst(name)
+        return res
+
+    def lgcl2tile(self, path: HierInstPath) -> HierInstPath | None:
+        """
+        tile path of logical instance path from top, None if not under a map line
+        """
+        return self.__translate(self.lgclIndex, path)
+
+    def tile2lgcl(self, path: HierInstPath) -> HierInstPath | None:
+        """
+        logical path of tile instance path from top, None if not under a map line
+        """
+        return self.__translate(self.tileIndex, path)
+
+    def translateStr(self, pathStr: str, toTile: bool = True, sep: str = ".") -> str | None:
+        """
+        translate an absolute path string, components after the instances (port names...)
+        and before top (like "chip") are kept, None if not under a map line
+        """
+        index = self.lgclIndex if toTile else self.tileIndex
+        components = pathStr.split(sep)
+        try:
+            start = components.index(self.prefix) + 1
+        except ValueError:
+            return None
+        # walk existing trie nodes only, ports are not added to the trie
+        mapped, depth = index.get(0), 0
+        node = 0
+        for idx in range(start, components.__len__()):
+            child = instPathTable.find(node, components[idx])
+            if child is None:
+                # not an instance of any path seen, like a port name:
+                # the rest is kept under the deepest mapped instance
+                break
+            node = child
+            target = index.get(node)
+            if target is not None:
+                mapped, depth = target, idx - start + 1
+        if mapped is None:
+            return None
+        return sep.join(
+            components[: start - 1] + [mapped.join(sep)] + components[start + depth :]
+        )
+
+    def translateAll(
+        self, pathStrs: Iterable[str], toTile: bool = True, sep: str = "."
+    ) -> Iterator[tuple[str, str | None]]:
+        """
+        (path, translated path or None) of every path string, streamed
+        """
+        for pathStr in pathStrs:
+            yield (pathStr, self.translateStr(pathStr, toTile, sep))
+
+    def checkModule(self, key: ModulesKey) -> list[MapMismatch]:
+        """
+        compare instances of the module in both views with its map lines
+        """
+        res = list[MapMismatch]()
+        mapLines = self.moduleMap[key]
+        for view, graph, module, mapPaths in (
+            ("logical", self.lgclView, key.lgcl, {x.lgcl for x in mapLines}),
+            ("tile", self.tileView, key.tile, {x.tile for x in mapLines}),
+        ):
+            # outer of a module path is its cached ancestor list
+            outerSet = set(graph.iterOuter(HierInstPath(module, ())))
+            if outerSet != mapPaths:
+                unmapped = tuple(sorted(outerSet - mapPaths, key=lambda x: x.instances))
+                unknown = tuple(sorted(mapPaths - outerSet, key=lambda x: x.instances))
+                res.append(MapMismatch(key, view, unmapped, unknown))
+        return res
+
+    def __checkMapLine(self, workers: int) -> list[MapMismatch]:
         lgclModuleSet = self.lgclView.modules()
         tileModuleSet = self.tileView.modules()
         lgclModuleInMap = {x.lgcl for x in self.moduleMap.keys()}
@@ -184,10 +334,42 @@ class LogicalTileMap:
         assert lgclModuleInMap.issubset(lgclModuleSet)
         assert tileModuleInMap.issubset(tileModuleSet)
 
-        for moduleKey, mapLines in self.moduleMap.items():
-            lgclOuterSet = set(self.lgclView.outer(HierInstPath(moduleKey.lgcl, ())))
-            lgclMapLineSet = {x.lgcl for x in mapLines}
-            compareSet(lgclOuterSet, lgclMapLineSet)
-            tileOuterSet = set(self.tileView.outer(HierInstPath(moduleKey.tile, ())))
-            tileMapLineSet = {x.tile for x in mapLines}
-            compareSet(tileOuterSet, tileMapLineSet)
\ No newline at end of file
+        keys = list(self.moduleMap.keys())
+        mismatches = list[MapMismatch]()
+        if workers <= 1 or "fork" not in get_all_start_methods():
+            for key in keys:
+                mismatches.extend(self.checkModule(key))
+        else:
+            # expand ancestors once before fork, workers share the caches
+            for key in keys:
+                next(self.lgclView.iterOuter(HierInstPath(key.lgcl, ())), None)
+                next(self.tileView.iterOuter(HierInstPath(key.tile, ())), None)
+            chunkSize = max(1, keys.__len__() // (workers * 8))
+            with get_context("fork").Pool(
+                workers, initializer=initCheckWorker, initargs=(self,)
+            ) as pool:
+                for res in pool.imap(checkModuleWorker, keys, chunkSize):
+                    mismatches.extend(res)
+        for mismatch in mismatches:
+            diag.warn(
+                "mapMismatch",
+                "%s module %s: %d instances without map line, %d map lines of no instance",
+                mismatch.view,
+                mismatch.key,
+                mismatch.unmapped.__len__(),
+                mismatch.unknown.__len__(),
+            )
+        return mismatches
+
+    def report(self) -> str:
+        """
+        all mismatches of map lines, empty if the map is consistent with both views
+        """
+        lines = list[str]()
+        for mismatch in self.mismatches:
+            lines.append(f"{mismatch.view} {mismatch.key.lgcl} -> {mismatch.key.tile}")
+            for path in mismatch.unmapped:
+                lines.append(f"  no map line: {path.join('.')}")
+            for path in mismatch.unknown:
+                lines.append(f"  not instance: {path.join('.')}")
+        return "\n".join(lines)
@@ -0,0 +1,123 @@
+"""
+multi-driver detection over the port topology
+
+drivers are counted once per net of a module definition (see NetIndex), bottom-up:
+a leaf port with direction output or inout drives its net,
+a sub module port adds the drivers of its net inside the sub module,
+an input or inout port of a root module is driven from outside.
+a net is reported where it stops climbing, if it has more than one driver.
+"""
+
+from .Utils import HierInstPath, PortDir
+from .Node import ModuleLink, PortWireNode
+from .NetIndex import NetIndex, NetId
+from dataclasses import dataclass, field
+from typing import Iterator
+
+DRIVER_DIRS = {PortDir.OUTPUT, PortDir.INOUT}
+ROOT_DRIVER_DIRS = {PortDir.INPUT, PortDir.INOUT}
+
+
+@dataclass
+class MultiDriveNet:
+    """
+    a multi-driven net of module, found at every instance of module in self.tops
+
+    self.tops: None if the module is a root, else the instantiations where the net stops
+    self.leaves: leaf ports of the net, relative to module
+    """
+
+    module: str
+    defNet: int
+    drivers: int
+    tops: list[ModuleLink] | None
+    leaves: list[tuple[HierInstPath, PortWireNode]] = field(repr=False)
+
+
+class MultiDriveChecker:
+    def __init__(self, netIndex: NetIndex) -> None:
+        self.netIndex = netIndex
+        self.graph = netIndex.graph
+        # definition net id -> drivers inside the module
+        self.drivers = list[int]()
+        # nets are numbered bottom-up, sub module nets are counted first
+        for net in range(self.netIndex.netModule.__len__()):
+            self.drivers.append(self.__countDrivers(net))
+
+    def __countDrivers(self, net: int) -> int:
+        count = 0
+        subNets = set[tuple[str, int]]()
+        for inst, port in self.netIndex.netMembers[net]:
+            assert port.module is not None
+            subNetOfPort = self.netIndex.netOfPort.get(port.module.name)
+            subNet = None if subNetOfPort is None else subNetOfPort.get(("", port.name))
+            if subNet is None:
+                if port.module.isLeaf() and port.dir in DRIVER_DIRS:
+                    count = count + 1
+            elif (inst, subNet) not in subNets:
+                # ports shorted in sub module share one sub net
+                subNets.add((inst, subNet))
+                count = count + self.drivers[subNet]
+        return count
+
+    def __tops(self, net: int) -> list[ModuleLink] | None:
+        """
+        instantiations of the module where none of the module ports in net is connected
+        """
+        module = self.netIndex.netModule[net]
+        if module.name in self.graph.roots:
+            return None
+        res = list[ModuleLink]()
+        for link, _ in self.graph.prevOf(module):
+            parentNetOfPort = self.netIndex.netOfPort.get(link.container, {})
+            if all(
+                (link.instance, selfPort) not in parentNetOfPort
+                for selfPort in self.netIndex.netSelfPorts[net]
+            ):
+                res.append(link)
+        return res
+
+    def check(self) -> list[MultiDriveNet]:
+        res = list[MultiDriveNet]()
+        for net, drivers in enumerate(self.drivers):
+            module = self.netIndex.netModule[net]
+            tops = self.__tops(net)
+            if tops is None:
+                for selfPort in self.netIndex.netSelfPorts[net]:
+                    if module.ports[selfPort].dir in ROOT_DRIVER_DIRS:
+                        drivers = drivers + 1
+            elif tops.__len__() == 0:
+                continue
+            if drivers < 2:
+                continue
+            leaves = self.netIndex.leafMembers(NetId(HierInstPath(module.name, ()), net))
+            res.append(MultiDriveNet(module.name, net, drivers, tops, leaves))
+        return res
+
+    def countInstances(self, multiDriveNet: MultiDriveNet) -> int:
+        """
+        number of instances multiDriveNet is found at, without expanding them
+        """
+        if multiDriveNet.tops is None:
+            return 1
+        return sum(
+            self.graph.countOf(link.container).occurrences for link in multiDriveNet.tops
+        )
+
+    def absoluteLeaves(
+        self, multiDriveNet: MultiDriveNet
+    ) -> Iterator[tuple[HierInstPath, PortWireNode]]:
+        """
+        absolute leaf ports of multiDriveNet at every instance it is found
+        """
+        if multiDriveNet.tops is None:
+            modulePaths = [HierInstPath(multiDriveNet.module, ())]
+        else:
+            modulePaths = [
+                parentPath.addInst(link.instance)
+                for link in multiDriveNet.tops
+                for parentPath in self.graph.iterOuter(HierInstPath(link.container, ()))
+            ]
+        for modulePath in modulePaths:
+            for leafPath, leafNode in multiDriveNet.leaves:
+                yield (modulePath.concat(leafPath), leafNode)
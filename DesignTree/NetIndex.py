@@ -0,0 +1,214 @@
+"""
+index of electrically equivalent ports across the whole hierarchy
+
+nets are built once per module definition by union-find over
+(sub instance name, port name) of the module, "" is the instance name of the module's own ports.
+port.xml links a module port to sub instance ports, a local wire links all of its ports,
+and ports shorted inside a sub module are shorted at every instance of it.
+
+a net of a definition is lifted to absolute instance paths on demand:
+it climbs through the module ports until the parent does not connect them.
+"""
+
+from .Utils import HierInstPath
+from .Node import ModuleNode, PortWireNode
+from .DesignTopoGraph import DesignTopoGraph
+from dataclasses import dataclass
+
+# (sub instance name, port name)
+PortKey = tuple[str, str]
+
+
+@dataclass(frozen=True)
+class NetId:
+    """
+    net defNet of the module at instPath
+    """
+
+    instPath: HierInstPath
+    defNet: int
+
+
+class NetIndex:
+    """
+    self.netModule: definition net id -> module node of the definition
+    self.netMembers: definition net id -> (sub instance name, port node) in the net
+    self.netSelfPorts: definition net id -> port names of the module in the net
+    self.netOfPort: module name -> (sub instance name, port name) -> definition net id
+    """
+
+    def __init__(self, graph: DesignTopoGraph) -> None:
+        self.graph = graph
+        self.netModule = list[ModuleNode]()
+        self.netMembers = list[list[tuple[str, PortWireNode]]]()
+        self.netSelfPorts = list[list[str]]()
+        self.netOfPort = dict[str, dict[PortKey, int]]()
+        # (instance path, port name) -> net id
+        self.cache = dict[tuple[HierInstPath, str], NetId | None]()
+        graph.loadPortTopo()
+        for node in self.__bottomUp():
+            self.__buildModule(node)
+
+    def __bottomUp(self) -> list[ModuleNode]:
+        """
+        container nodes, sub modules before the modules instantiating them
+        """
+        order = list[ModuleNode]()
+        done = set[str]()
+        for root in self.graph.nodes.values():
+            stack = [(root, False)]
+            while stack.__len__() > 0:
+                node, expanded = stack.pop()
+                if node.name in done or node.isLeaf():
+                    continue
+                if expanded:
+                    done.add(node.name)
+                    order.append(node)
+                    continue
+                stack.append((node, True))
+                for sub in node.next.values():
+                    if sub.name not in done:
+                        stack.append((sub, False))
+        return order
+
+    def __buildModule(self, node: ModuleNode):
+        parent = dict[PortKey, PortKey]()
+        ports = dict[PortKey, PortWireNode]()
+
+        def find(key: PortKey) -> PortKey:
+            root = parent.setdefault(key, key)
+            while parent[root] != root:
+                root = parent[root]
+            while parent[key] != root:
+                parent[key], key = root, parent[key]
+            return root
+
+        def union(lhs: PortKey, rhs: PortKey):
+            lhsRoot, rhsRoot = find(lhs), find(rhs)
+            if lhsRoot != rhsRoot:
+                parent[lhsRoot] = rhsRoot
+
+        for name, port in node.ports.items():
+            selfKey = ("", name)
+            ports[selfKey] = port
+            find(selfKey)
+            for link, innerPort in port.inner.items():
+                innerKey = (link.thatInst, innerPort.name)
+                ports[innerKey] = innerPort
+                union(selfKey, innerKey)
+        for net in node.local.values():
+            first = (net.members[0][0], net.members[0][1].name)
+            for inst, port in net.members:
+                key = (inst, port.name)
+                ports[key] = port
+                union(first, key)
+        # ports shorted inside sub module
+        for inst, sub in node.next.items():
+            subNetOfPort = self.netOfPort.get(sub.name)
+            if subNetOfPort is None:
+                continue
+            for name, port in sub.ports.items():
+                subNet = subNetOfPort.get(("", name))
+                if subNet is None or self.netSelfPorts[subNet].__len__() < 2:
+                    continue
+                key = (inst, name)
+                ports[key] = port
+                union(key, (inst, self.netSelfPorts[subNet][0]))
+
+        netOfPort = dict[PortKey, int]()
+        netOfRoot = dict[PortKey, int]()
+        for key, port in ports.items():
+            root = find(key)
+            netId = netOfRoot.get(root)
+            if netId is None:
+                netId = self.netModule.__len__()
+                netOfRoot[root] = netId
+                self.netModule.append(node)
+                self.netMembers.append([])
+                self.netSelfPorts.append([])
+            netOfPort[key] = netId
+            if key[0] == "":
+                self.netSelfPorts[netId].append(key[1])
+            else:
+                self.netMembers[netId].append((key[0], port))
+        self.netOfPort[node.name] = netOfPort
+
+    def __modulesOn(self, instPath: HierInstPath) -> list[ModuleNode] | None:
+        node = self.graph.nodes.get(instPath.module)
+        if node is None:
+            return None
+        res = [node]
+        for instanceName in instPath.instances:
+            sub = res[-1].next.get(instanceName)
+            if sub is None:
+                return None
+            res.append(sub)
+        return res
+
+    def netOf(self, instPath: HierInstPath, port: str) -> NetId | None:
+        """
+        net of port of the instance at instPath, None if the port is not connected
+        instPath should start from a root, the net stops at the root
+        """
+        key = (instPath, port)
+        if key in self.cache:
+            return self.cache[key]
+        netId = self.__netOf(instPath, port)
+        self.cache[key] = netId
+        return netId
+
+    def __netOf(self, instPath: HierInstPath, port: str) -> NetId | None:
+        modules = self.__modulesOn(instPath)
+        if modules is None:
+            return None
+        instances = instPath.instances
+        level = instances.__len__()
+        if level == 0:
+            net = self.netOfPort.get(instPath.module, {}).get(("", port))
+            return None if net is None else NetId(instPath, net)
+        # the port of the instance in the definition of its parent
+        level = level - 1
+        net = self.netOfPort.get(modules[level].name, {}).get((instances[level], port))
+        if net is None:
+            # not connected in the parent, the net inside the module of the instance
+            net = self.netOfPort.get(modules[level + 1].name, {}).get(("", port))
+            return None if net is None else NetId(instPath, net)
+        # climb while a module port of the net is connected in the parent definition
+        while level > 0:
+            parentNetOfPort = self.netOfPort[modules[level - 1].name]
+            parentNet = None
+            for selfPort in self.netSelfPorts[net]:
+                parentNet = parentNetOfPort.get((instances[level - 1], selfPort))
+                if parentNet is not None:
+                    break
+            if parentNet is None:
+                break
+            net = parentNet
+            level = level - 1
+        return NetId(HierInstPath(instPath.module, instances[:level]), net)
+
+    def sameNet(self, lhs: HierInstPath, lhsPort: str, rhs: HierInstPath, rhsPort: str):
+        lhsNet = self.netOf(lhs, lhsPort)
+        return lhsNet is not None and lhsNet == self.netOf(rhs, rhsPort)
+
+    def leafMembers(self, netId: NetId) -> list[tuple[HierInstPath, PortWireNode]]:
+        """
+        (instance path, port node) of all leaf ports in the net
+        """
+        res = list[tuple[HierInstPath, PortWireNode]]()
+        visited = {(netId.instPath, netId.defNet)}
+        stack = [(netId.instPath, netId.defNet)]
+        while stack.__len__() > 0:
+            instPath, net = stack.pop()
+            for inst, port in self.netMembers[net]:
+                subPath = instPath.addInst(inst)
+                assert port.module is not None
+                subNet = self.netOfPort.get(port.module.name, {}).get(("", port.name))
+                if subNet is None:
+                    if port.module.isLeaf():
+                        res.append((subPath, port))
+                    continue
+                if (subPath, subNet) not in visited:
+                    visited.add((subPath, subNet))
+                    stack.append((subPath, subNet))
+        return res
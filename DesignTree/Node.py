@@ -1,9 +1,10 @@
-from DesignTree.Utils import HierInstPath, WireRange, dictAdd, cl
+from DesignTree.Utils import HierInstPath, PortDir, WireRange, dictAdd, diag
 from DesignTree.PortXml import PortXmlParser, WireConnec, EndBlock
 from dataclasses import dataclass, field
+from typing import Callable
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ModuleLink:
     container: str
     instance: str
@@ -16,8 +17,21 @@ class ModuleNode:
     self.name: module name
     self.next: name of instance in the module -> inner module node
     self.prev: instance name of self in the outer module -> outer module node
+    self.loader: lazy mode, load port.xml and local_connect.xml of self when first needed
+    self.loaded: port.xml and local_connect.xml of self are loaded
     """
 
+    __slots__ = (
+        "name",
+        "next",
+        "prev",
+        "ports",
+        "local",
+        "bundle2wire",
+        "loader",
+        "loaded",
+    )
+
     def __init__(self, name: str) -> None:
         self.name: str = name
         # sub instance name -> module node
@@ -26,14 +40,26 @@ class ModuleNode:
         self.prev = dict[ModuleLink, ModuleNode]()
         # port name -> port node
         self.ports = dict[str, PortWireNode]()
-        # local connect: wire name -> instance name, port node
-        self.local = dict[str, list[tuple[str, PortWireNode]]]()
+        # local connect: wire name -> net of the wire
+        self.local = dict[str, NetNode]()
         # bundle name to wire name set
         self.bundle2wire = dict[str, set[str]]()
+        # None if the port topology of self is loaded or self is a leaf
+        self.loader: Callable[[ModuleNode], None] | None = None
+        self.loaded = False
 
     def isLeaf(self):
         return self.next.__len__() == 0
 
+    def ensureLoaded(self):
+        """
+        load the port topology of self if not loaded,
+        ports of self may exist before, created by the containers instantiating self
+        """
+        if self.loader is not None:
+            loader, self.loader = self.loader, None
+            loader(self)
+
     def __getOrInsertPortNode(self, endBlock: EndBlock, wireRange: WireRange):
         """
         get the port node if the port of end block is exist in self.ports
@@ -46,7 +72,7 @@ class ModuleNode:
             assert portNode.range == wireRange
             assert portNode.module == self
         else:
-            portNode = PortWireNode(endBlock, wireRange, self)
+            portNode = PortWireNode(portName, endBlock.wireDir, wireRange, self)
             self.ports[portName] = portNode
         return portNode
 
@@ -125,8 +151,11 @@ class ModuleNode:
             dictAdd(self.bundle2wire, bundleName, wireNameSet)
 
             for wireName, wireConnec in bundleConnec.wires.items():
-                # (instance name, port node)
-                portNodeList = list[tuple[str, PortWireNode]]()
+                # empty end blocks are skipped by the parser, a wire may have none left
+                if wireConnec.endBlocks.__len__() == 0:
+                    continue
+                # one net node per wire, linked with every end block
+                net = NetNode(self.name, wireName, bundleName)
                 for endBlock in wireConnec.endBlocks:
                     # new inner port node
                     subModuleNode = self.next.get(endBlock.instName)
@@ -138,38 +167,59 @@ class ModuleNode:
                         self.next[endBlock.instName] = subModuleNode
                         moduleLink = ModuleLink(self.name, endBlock.instName)
                         subModuleNode.prev[moduleLink] = self
-                        cl.warning(
-                            f"Not found module {endBlock.moduleName} in info.yaml"
+                        diag.warn(
+                            "missingModule",
+                            "Not found module %s in info.yaml",
+                            endBlock.moduleName,
                         )
-                    portNode = PortWireNode(endBlock, wireConnec.range, subModuleNode)
                     portNode = subModuleNode.__getOrInsertPortNode(
                         endBlock, wireConnec.range
                     )
-                    portNodeList.append((endBlock.instName, portNode))
-
-                for i in range(portNodeList.__len__()):
-                    iInstName, iPortNode = portNodeList[i]
-                    for j in range(i + 1, portNodeList.__len__()):
-                        jInstName, jPortNode = portNodeList[j]
-                        forward, backward = self.doubleLink(
-                            wireConnec,
-                            iInstName,
-                            jInstName,
-                            iPortNode,
-                            jPortNode,
-                        )
-                        assert iPortNode.module is not None
-                        assert jPortNode.module is not None
-                        dictAdd(iPortNode.outer, forward, jPortNode)
-                        dictAdd(jPortNode.outer, backward, iPortNode)
+                    net.members.append((endBlock.instName, portNode))
+                    portNode.nets.append((endBlock.instName, net))
 
-                dictAdd(self.local, wireName, portNodeList)
+                dictAdd(self.local, wireName, net)
+
+    def unloadPortTopo(self) -> list["ModuleNode"]:
+        """
+        undo loadPortXml and loadLocalConnec of self, before loading new xml of self.
+        return self and its leaf sub modules, whose ports may be left unlinked,
+        call dropUnlinkedPorts on them after every changed container is unloaded,
+        so a port linked by another changed container is dropped as well
+        """
+        subNodes = set(self.next.values())
+        for port in self.ports.values():
+            for link, innerPort in port.inner.items():
+                backward = WireLink(
+                    self.name, link.thatInst, "", port.name, link.wire, link.bundle
+                )
+                innerPort.outer.pop(backward)
+            port.inner.clear()
+        for net in self.local.values():
+            for inst, port in net.members:
+                port.nets = [(i, n) for i, n in port.nets if n is not net]
+        self.local.clear()
+        self.bundle2wire.clear()
+        self.loaded = False
+        return [self] + [node for node in subNodes if node.isLeaf()]
+
+    def dropUnlinkedPorts(self):
+        """
+        remove ports not linked by any container, they are created again by the next load.
+        port nodes still linked by other containers are kept, so their links stay valid
+        """
+        for name, port in list(self.ports.items()):
+            unlinked = port.inner.__len__() == 0 and port.outer.__len__() == 0
+            if unlinked and port.nets.__len__() == 0:
+                port.module = None
+                self.ports.pop(name)
 
     def portOf(self, bundle: str):
         """
         return None if bundle is not found in this module
         else return a list of PortWireNode of this Module's port
         """
+        self.ensureLoaded()
         wireSet = self.bundle2wire.get(bundle)
         if wireSet is not None:
             res = list[PortWireNode]()
@@ -181,18 +231,19 @@ class ModuleNode:
         return None
 
     def localOf(self, bundle: str):
+        self.ensureLoaded()
         wireSet = self.bundle2wire.get(bundle)
         if wireSet is not None:
             res = list[tuple[str, PortWireNode]]()
             for wireName in wireSet:
-                localList = self.local.get(wireName)
-                if localList is not None:
-                    res.extend(map(lambda x: x, localList))
+                net = self.local.get(wireName)
+                if net is not None:
+                    res.extend(net.members)
             return res
         return None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class WireLink:
     container: str
     # if is container port, it should be sub instance name
@@ -204,27 +255,48 @@ class WireLink:
     bundle: str = field(compare=False)
 
 
+class NetNode:
+    """
+    Node for a wire in local_connect.xml, linking all ports on the wire
+
+    self.members: (sub instance name, port node) of every end block of the wire
+    """
+
+    __slots__ = ("container", "wire", "bundle", "members")
+
+    def __init__(self, container: str, wire: str, bundle: str) -> None:
+        self.container = container
+        self.wire = wire
+        self.bundle = bundle
+        self.members = list[tuple[str, PortWireNode]]()
+
+
 class PortWireNode:
     """
     Node for Hierarchy Port Tree
     """
 
+    __slots__ = ("dir", "name", "range", "module", "inner", "outer", "nets")
+
     def __init__(
-        self, endBlock: EndBlock, wireRange: WireRange, moduleNode: ModuleNode
+        self, name: str, dir: PortDir, wireRange: WireRange, moduleNode: ModuleNode
     ) -> None:
-        self.dir = endBlock.wireDir
-        self.name = endBlock.portWireName
+        self.dir = dir
+        self.name = name
         self.range = wireRange
         self.module: ModuleNode | None = moduleNode
         # sub instance name + port name -> port node
         self.inner = dict[WireLink, PortWireNode]()
         # parent instance name + port name -> port node
-        # include peers and parents
         self.outer = dict[WireLink, PortWireNode]()
+        # (self instance name, local wire net) of the containers instantiating self.module
+        self.nets = list[tuple[str, NetNode]]()
 
     def leaves(
         self, instPath: HierInstPath
     ) -> list[tuple[HierInstPath, "PortWireNode"]]:
+        if self.module is not None:
+            self.module.ensureLoaded()
         if self.inner.__len__() == 0:
             return [(instPath, self)]
         res = list[tuple[HierInstPath, "PortWireNode"]]()
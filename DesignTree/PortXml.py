@@ -18,11 +18,15 @@ pears:  模块内相互连接, (父模块名称 + 实例化名称) -> 父模块
 port_signal_name: 端口名
 """
 
-from .Utils import PortDir, cl, WireRange, dictAdd
+from .Utils import FileStamp, PortDir, StampedReader, cl, diag, WireRange, dictAdd
+from .Stats import stats
 from xml.etree.ElementTree import Element
 from xml.etree import ElementTree as ET
-from typing import TypeAlias
+from typing import IO, Iterable, Iterator, TypeAlias
+from multiprocessing import Pool
+from sys import intern
 import os
+import time
 
 
 class EndBlock:
@@ -35,6 +39,17 @@ class EndBlock:
         port_signal_dir="input"
         port_dir="receive"/>
     """
+
+    __slots__ = (
+        "instName",
+        "moduleName",
+        "portBundleName",
+        "portWireName",
+        "wireDir",
+        "bundleDir",
+        "wireLink",
+    )
+
     def __init__(self) -> None:
         self.instName: str
         self.moduleName = str()
@@ -59,13 +74,32 @@ class WireConnec:
             <end_block ... />
     </wire>
     """
+
+    __slots__ = ("name", "range", "endBlocks", "bundleLink", "moduleIndex")
+
+    # most wires have a few end blocks, scanning them is cheaper than a dict per wire
+    INDEX_THRESHOLD = 16
+
     def __init__(self, name: str, msb: int, lsb: int) -> None:
         self.name: str = name
-        self.range = WireRange(msb, lsb)
+        self.range = WireRange.of(msb, lsb)
         self.endBlocks = list[EndBlock]()
         self.bundleLink: BundleConnec | None = None  # back link
+        # module name -> first end block of the module, None until the wire fans out
+        self.moduleIndex: dict[str, EndBlock] | None = None
+
+    def addEndBlock(self, endBlock: EndBlock):
+        self.endBlocks.append(endBlock)
+        if self.moduleIndex is not None:
+            self.moduleIndex.setdefault(endBlock.moduleName, endBlock)
+        elif self.endBlocks.__len__() > WireConnec.INDEX_THRESHOLD:
+            self.moduleIndex = dict[str, EndBlock]()
+            for eb in self.endBlocks:
+                self.moduleIndex.setdefault(eb.moduleName, eb)
 
     def endBlockOf(self, moduleName: str):
+        if self.moduleIndex is not None:
+            return self.moduleIndex.get(moduleName)
         for eb in self.endBlocks:
             if eb.moduleName == moduleName:
                 return eb
@@ -79,6 +113,9 @@ class BundleConnec:
     """
     Data struct for Bundle element in PortXml
     """
+
+    __slots__ = ("name", "wires")
+
     def __init__(self, name: str) -> None:
         # not equal to port_name(port interface name) of end_block
         self.name: str = name
@@ -89,52 +126,184 @@ class BundleConnec:
         return f"{self.name}"
 
 
+# compact picklable records of port/local_connect xml, used to pass xml between processes
+# (block_inst_name, block_class_name, port_name, port_signal_name, port_signal_dir, port_dir)
+EndBlockRecord: TypeAlias = tuple[str, str, str, str, str, str]
+# (name, high_bit, low_bit, end blocks)
+WireRecord: TypeAlias = tuple[str, int, int, list[EndBlockRecord]]
+# (name, wires)
+BundleRecord: TypeAlias = tuple[str, list[WireRecord]]
+
+
+def endBlockRecord(attrib: dict[str, str]) -> EndBlockRecord:
+    # empty end block may have no direction
+    return (
+        attrib["block_inst_name"],
+        attrib["block_class_name"],
+        attrib["port_name"],
+        attrib["port_signal_name"],
+        attrib.get("port_signal_dir", ""),
+        attrib.get("port_dir", ""),
+    )
+
+
+def wireRecord(attrib: dict[str, str]) -> WireRecord:
+    return (attrib["name"], int(attrib["high_bit"]), int(attrib["low_bit"]), [])
+
+
+def domRecords(root: Element, moduleName: str) -> Iterator[BundleRecord]:
+    """
+    records of each bundle in a parsed DOM
+    """
+    assert root.attrib["container"] == moduleName
+    for bundleElem in root.findall("bundle"):
+        assert isinstance(bundleElem, Element)
+        wires = list[WireRecord]()
+        for wireElem in bundleElem.findall("wire"):
+            wire = wireRecord(wireElem.attrib)
+            for endBlockElem in wireElem.findall("end_block"):
+                wire[3].append(endBlockRecord(endBlockElem.attrib))
+            wires.append(wire)
+        yield (bundleElem.attrib["name"], wires)
+
+
+def streamRecords(
+    xmlFile: str | IO[bytes] | StampedReader, moduleName: str
+) -> Iterator[BundleRecord]:
+    """
+    xmlFile: path or binary reader of the xml file
+    streaming records built on iterparse events of bundle/wire/end_block,
+    elements are cleared when they end,
+    so peak memory is proportional to one bundle rather than the whole file
+    """
+    bundle: BundleRecord | None = None
+    wire: WireRecord | None = None
+    # only bundle(depth 2) -> wire(depth 3) -> end_block(depth 4) is parsed,
+    # the same as findall on the DOM
+    depth = 0
+    root: Element | None = None
+    for event, elem in ET.iterparse(xmlFile, events=("start", "end")):
+        if event == "start":
+            depth = depth + 1
+            if depth == 1:
+                assert elem.attrib["container"] == moduleName
+                root = elem
+            elif depth == 2 and elem.tag == "bundle":
+                bundle = (elem.attrib["name"], [])
+            elif depth == 3 and elem.tag == "wire" and bundle is not None:
+                wire = wireRecord(elem.attrib)
+                bundle[1].append(wire)
+            elif depth == 4 and elem.tag == "end_block" and wire is not None:
+                wire[3].append(endBlockRecord(elem.attrib))
+            continue
+        # end event
+        depth = depth - 1
+        if depth == 1:
+            # drop finished bundle (and anything else) from the root
+            assert root is not None
+            root.clear()
+            if bundle is not None:
+                yield bundle
+            bundle = None
+        elif depth == 2:
+            wire = None
+            elem.clear()
+
+
+def loadRecords(
+    task: tuple[str, str]
+) -> tuple[str, list[BundleRecord], list[BundleRecord], tuple[FileStamp, FileStamp], float]:
+    """
+    worker of PortXmlReader.loadAll, parse port.xml and local_connect.xml of one container
+    task: (xml dir, module name)
+    return (module name, port records, local connect records,
+    stamps of the two files, seconds of parsing)
+    """
+    dirName, moduleName = task
+    start = time.perf_counter()
+    with StampedReader(f"{dirName}/{moduleName}_port.xml") as source:
+        portRecords = list(streamRecords(source, moduleName))
+        portStamp = source.stamp()
+    with StampedReader(f"{dirName}/{moduleName}_local_connect.xml") as source:
+        localRecords = list(streamRecords(source, moduleName))
+        localStamp = source.stamp()
+    return (
+        moduleName,
+        portRecords,
+        localRecords,
+        (portStamp, localStamp),
+        time.perf_counter() - start,
+    )
+
+
 class PortXmlParser:
     """
     Only one assumption
     bundle name and wire name is unique
+
+    PortXmlParser(root, moduleName) builds from a parsed DOM,
+    PortXmlParser.fromFile(xmlFile, moduleName) streams the xml file,
+    PortXmlParser.fromRecords(records, moduleName) builds from records of other process
     """
 
-    def __init__(self, root: Element, moduleName: str) -> None:
-        assert root.attrib["container"] == moduleName
+    def __init__(self, root: Element | None, moduleName: str) -> None:
+        self.moduleName = moduleName
         self.bundleDict = dict[str, BundleConnec]()
         self.wireDict = dict[str, WireConnec]()
-        for bundleElem in root.findall("bundle"):
-            assert isinstance(bundleElem, Element)
-            bundleConnec = BundleConnec(bundleElem.attrib["name"])
+        if root is not None:
+            self.__addRecords(domRecords(root, moduleName))
+
+    @staticmethod
+    def fromFile(
+        xmlFile: str | IO[bytes] | StampedReader, moduleName: str
+    ) -> "PortXmlParser":
+        parser = PortXmlParser(None, moduleName)
+        parser.__addRecords(streamRecords(xmlFile, moduleName))
+        return parser
+
+    @staticmethod
+    def fromRecords(records: Iterable[BundleRecord], moduleName: str) -> "PortXmlParser":
+        parser = PortXmlParser(None, moduleName)
+        parser.__addRecords(records)
+        return parser
+
+    def __addRecords(self, records: Iterable[BundleRecord]):
+        for bundleName, wires in records:
+            bundleConnec = BundleConnec(intern(bundleName))
             dictAdd(self.bundleDict, bundleConnec.name, bundleConnec)
-            for wireElem in bundleElem.findall("wire"):
-                wireConnec = WireConnec(
-                    name=wireElem.attrib["name"],
-                    msb=int(wireElem.attrib["high_bit"]),
-                    lsb=int(wireElem.attrib["low_bit"]),
-                )
+            for wireName, msb, lsb, endBlocks in wires:
+                wireConnec = WireConnec(name=intern(wireName), msb=msb, lsb=lsb)
                 dictAdd(self.wireDict, wireConnec.name, wireConnec)
                 wireConnec.bundleLink = bundleConnec  # set link of bundleConnec
-                for endBlockElem in wireElem.findall("end_block"):
-                    endBlock = EndBlock()
-                    endBlock.instName = endBlockElem.attrib["block_inst_name"]
-                    endBlock.moduleName = endBlockElem.attrib["block_class_name"]
-                    endBlock.portBundleName = endBlockElem.attrib["port_name"]
-                    endBlock.portWireName = endBlockElem.attrib["port_signal_name"]
-                    if endBlock.portBundleName == "" or endBlock.portWireName == "":
-                        cl.warning(
-                            f"skip {moduleName}_port/local_connect.xml bundle {bundleConnec.name}'s wire {wireConnec.name} empty endBlock"
-                        )
-                        continue
-                    # direction
-                    endBlock.wireDir = PortDir.fromStr(
-                        endBlockElem.attrib["port_signal_dir"]
-                    )
-                    endBlock.bundleDir = PortDir.fromStr(
-                        endBlockElem.attrib["port_dir"]
-                    )
-                    # set link of bundleConnec
-                    endBlock.wireLink = wireConnec
-                    wireConnec.endBlocks.append(endBlock)
-
+                for endBlockRec in endBlocks:
+                    self.__addEndBlock(wireConnec, endBlockRec)
                 dictAdd(bundleConnec.wires, wireConnec.name, wireConnec)
 
+    def __addEndBlock(self, wireConnec: WireConnec, record: EndBlockRecord):
+        # names are shared by many end blocks and port nodes, keep one copy of them
+        endBlock = EndBlock()
+        endBlock.instName = intern(record[0])
+        endBlock.moduleName = intern(record[1])
+        endBlock.portBundleName = intern(record[2])
+        endBlock.portWireName = intern(record[3])
+        if endBlock.portBundleName == "" or endBlock.portWireName == "":
+            bundleConnec = wireConnec.bundleLink
+            assert bundleConnec is not None
+            diag.warn(
+                "emptyEndBlock",
+                "skip %s_port/local_connect.xml bundle %s's wire %s empty endBlock",
+                self.moduleName,
+                bundleConnec.name,
+                wireConnec.name,
+            )
+            return
+        # direction
+        endBlock.wireDir = PortDir.fromStr(record[4])
+        endBlock.bundleDir = PortDir.fromStr(record[5])
+        # set link of bundleConnec
+        endBlock.wireLink = wireConnec
+        wireConnec.addEndBlock(endBlock)
+
 
 def scanFileFrom(dir: str, suffix: str):
     return {
@@ -149,8 +318,17 @@ moduleXmlMap: TypeAlias = dict[str, PortXmlParser]
 
 
 class PortXmlReader:
-    def __init__(self, portXmlDir: str, containerSet: set[str]) -> None:
+    """
+    load <module>_port.xml and <module>_local_connect.xml from portXmlDir when needed
+
+    stream: parse xml with PortXmlParser.fromFile instead of building the whole DOM
+    """
+
+    def __init__(
+        self, portXmlDir: str, containerSet: set[str], stream: bool = False
+    ) -> None:
         self.dirName: str = portXmlDir
+        self.stream = stream
         # get all *_port.xml from xml dir, consistent a set
         portXmlSet = scanFileFrom(portXmlDir, "_port.xml")
         # get all *_local_connect.xml from xml dir, consistent a set
@@ -158,9 +336,9 @@ class PortXmlReader:
 
         for container in containerSet:
             if container not in portXmlSet:
-                cl.warning(f"miss {container}_port.xml in {portXmlDir}")
+                cl.warning("miss %s_port.xml in %s", container, portXmlDir)
             if container not in localConnectSet:
-                cl.warning(f"miss {container}_local_connect.xml in {portXmlDir}")
+                cl.warning("miss %s_local_connect.xml in %s", container, portXmlDir)
 
         self.containerSet = containerSet
 
@@ -169,6 +347,8 @@ class PortXmlReader:
             "port": moduleXmlMap(),
             "local_connect": moduleXmlMap(),
         }
+        # (module name, suffix) -> stamp of the xml file when it is loaded
+        self.stamps = dict[tuple[str, str], FileStamp]()
 
     def __fromModuleDict(self, moduleName: str, suffix: str) -> PortXmlParser | None:
         d = self.xmls[suffix]
@@ -179,13 +359,87 @@ class PortXmlReader:
                 return d[moduleName]
             # load xml when needed
             else:
-                tree = ET.parse(f"{self.dirName}/{moduleName}_{suffix}.xml")
-                parser = PortXmlParser(tree.getroot(), moduleName)
+                xmlFile = self.xmlFile(moduleName, suffix)
+                with stats.stage("parseXml") as record, StampedReader(xmlFile) as source:
+                    start = stats.clock()
+                    if self.stream:
+                        parser = PortXmlParser.fromFile(source, moduleName)
+                    else:
+                        parser = PortXmlParser(ET.parse(source).getroot(), moduleName)
+                    # stamp of the content parsed, the file is read only once
+                    self.stamps[(moduleName, suffix)] = source.stamp()
+                    record.items = record.items + parser.wireDict.__len__()
+                    stats.container(moduleName, start, parser.wireDict.__len__())
                 dictAdd(d, moduleName, parser)
                 return parser
         else:
             return None
 
+    def xmlFile(self, moduleName: str, suffix: str) -> str:
+        return f"{self.dirName}/{moduleName}_{suffix}.xml"
+
     def load(self, moduleName: str, suffix: str) -> PortXmlParser | None:
         assert suffix == "port" or suffix == "local_connect"
         return self.__fromModuleDict(moduleName, suffix)
+
+    def loadAll(
+        self, moduleNames: list[str], workers: int = 1
+    ) -> Iterator[tuple[str, PortXmlParser, PortXmlParser]]:
+        """
+        load port.xml and local_connect.xml of moduleNames, in the order of moduleNames
+        yield (module name, port parser, local connect parser)
+
+        workers > 1: xml are parsed to records in worker processes,
+        parsers are built from the records in this process.
+        the parseXml cost of a container includes its parsing in the worker
+        """
+        if workers <= 1:
+            for moduleName in moduleNames:
+                portXml = self.load(moduleName, "port")
+                localConnect = self.load(moduleName, "local_connect")
+                assert portXml is not None and localConnect is not None
+                yield (moduleName, portXml, localConnect)
+            return
+
+        for moduleName in moduleNames:
+            assert moduleName in self.containerSet
+            assert moduleName not in self.xmls["port"]
+            assert moduleName not in self.xmls["local_connect"]
+        tasks = [(self.dirName, moduleName) for moduleName in moduleNames]
+        chunkSize = max(1, tasks.__len__() // (workers * 8))
+        with Pool(workers) as pool:
+            for moduleName, portRecords, localRecords, fileStamps, seconds in pool.imap(
+                loadRecords, tasks, chunkSize
+            ):
+                # stamps of the content parsed by the worker
+                self.stamps[(moduleName, "port")] = fileStamps[0]
+                self.stamps[(moduleName, "local_connect")] = fileStamps[1]
+                with stats.stage("parseXml") as record:
+                    start = stats.clock()
+                    portXml = PortXmlParser.fromRecords(portRecords, moduleName)
+                    dictAdd(self.xmls["port"], moduleName, portXml)
+                    localConnect = PortXmlParser.fromRecords(localRecords, moduleName)
+                    dictAdd(self.xmls["local_connect"], moduleName, localConnect)
+                    wires = portXml.wireDict.__len__() + localConnect.wireDict.__len__()
+                    record.items = record.items + wires
+                    stats.container(moduleName, start, wires)
+                    stats.container(moduleName, 0.0, 0, seconds)
+                yield (moduleName, portXml, localConnect)
+
+    def changed(self) -> set[str]:
+        """
+        modules whose port.xml or local_connect.xml is changed since it is loaded
+        """
+        return {
+            moduleName
+            for (moduleName, _), stamp in self.stamps.items()
+            if stamp.isChanged()
+        }
+
+    def drop(self, moduleName: str):
+        """
+        forget the loaded xml of moduleName, the next load parses the file again
+        """
+        for suffix, d in self.xmls.items():
+            d.pop(moduleName, None)
+            self.stamps.pop((moduleName, suffix), None)
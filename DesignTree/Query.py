@@ -0,0 +1,101 @@
+"""
+queries on the port topology of DesignTopoGraph, cached for repeated requests
+
+LeafPortQuery: leaf ports of a bundle in a container
+"""
+
+from .Utils import HierInstPath
+from .Node import PortWireNode
+from .DesignTopoGraph import DesignTopoGraph
+from typing import Iterable, Iterator
+
+# (instance path, leaf port node)
+LeafPort = tuple[HierInstPath, PortWireNode]
+
+
+class LeafPortQuery:
+    """
+    leaf ports of bundles in containers
+
+    leaves of every port node are expanded once and shared by all requests,
+    identical (container, bundle) requests are only resolved once,
+    call clear() after the port topology is changed
+    """
+
+    def __init__(self, graph: DesignTopoGraph) -> None:
+        self.graph = graph
+        # port node -> leaf ports, instance path is relative to the module of port node
+        self.leavesCache = dict[PortWireNode, list[LeafPort]]()
+        # (container, bundle) -> leaf ports, instance path is relative to container
+        self.bundleCache = dict[tuple[str, str], list[LeafPort]]()
+
+    def clear(self):
+        self.leavesCache.clear()
+        self.bundleCache.clear()
+
+    def leavesOf(self, portNode: PortWireNode) -> list[LeafPort]:
+        """
+        same as portNode.leaves, but relative to the module of portNode and cached
+        """
+        cached = self.leavesCache.get(portNode)
+        if cached is not None:
+            return cached
+        assert portNode.module is not None
+        portNode.module.ensureLoaded()
+        root = HierInstPath(portNode.module.name, ())
+        res = list[LeafPort]()
+        if portNode.inner.__len__() == 0:
+            res.append((root, portNode))
+        for link, node in portNode.inner.items():
+            instPath = root.addInst(link.thatInst)
+            for subPath, leafNode in self.leavesOf(node):
+                res.append((instPath.concat(subPath), leafNode))
+        self.leavesCache[portNode] = res
+        return res
+
+    def bundleLeaves(self, container: str, bundle: str) -> list[LeafPort]:
+        """
+        leaf ports of bundle in both port.xml and local_connect.xml of container,
+        instance path is relative to container
+        """
+        key = (container, bundle)
+        cached = self.bundleCache.get(key)
+        if cached is not None:
+            return cached
+        moduleNode = self.graph.nodes[container]
+        nodeOfModulePort = moduleNode.portOf(bundle)
+        assert nodeOfModulePort is not None
+        nodeOfLocalConnect = moduleNode.localOf(bundle)
+        assert nodeOfLocalConnect is not None
+
+        root = HierInstPath(container, ())
+        res = dict[LeafPort, None]()
+        for node in nodeOfModulePort:
+            for subPath, leafNode in self.leavesOf(node):
+                res[(root.concat(subPath), leafNode)] = None
+        for instName, node in nodeOfLocalConnect:
+            instPath = root.addInst(instName)
+            for subPath, leafNode in self.leavesOf(node):
+                res[(instPath.concat(subPath), leafNode)] = None
+        leaves = list(res.keys())
+        self.bundleCache[key] = leaves
+        return leaves
+
+    def absoluteLeaves(self, requests: Iterable[tuple[str, str]]) -> Iterator[LeafPort]:
+        """
+        absolute leaf ports of (container, bundle) requests,
+        each absolute leaf port is yielded once, in the order of first appearance
+        """
+        doneRequests = set[tuple[str, str]]()
+        doneLeaves = set[LeafPort]()
+        for request in requests:
+            if request in doneRequests:
+                continue
+            doneRequests.add(request)
+            for instPath, leafNode in self.bundleLeaves(*request):
+                for absPath in self.graph.iterOuter(instPath):
+                    leafPort = (absPath, leafNode)
+                    if leafPort in doneLeaves:
+                        continue
+                    doneLeaves.add(leafPort)
+                    yield leafPort
@@ -0,0 +1,236 @@
+"""
+binary snapshot of DesignTopoGraph, including the port topology
+
+the graph is flattened to index tables, so loading does not recurse through the node links.
+a snapshot records the FileStamp of every input file of the graph,
+it is stale if any input file is changed or the build key is different.
+
+saveSnapshot: write graph to snapshot file
+loadSnapshot: read graph from snapshot file, None if missing or stale
+loadOrBuild: load snapshot, or build the graph and save it
+"""
+
+from .Utils import PortDir, WireRange, cl
+from .Node import ModuleNode, ModuleLink, NetNode, PortWireNode, WireLink
+from .DesignTopoGraph import DesignTopoGraph
+from .Stats import stats
+from typing import Any, Callable, TypeVar
+import os
+import pickle
+
+SNAPSHOT_VERSION = 3
+# errors of unpickling a truncated or corrupted file
+UNREADABLE_ERRORS = (
+    pickle.UnpicklingError,
+    EOFError,
+    AttributeError,
+    ImportError,
+    IndexError,
+    KeyError,
+    TypeError,
+    ValueError,
+)
+
+G = TypeVar("G", bound=DesignTopoGraph)
+
+
+def flatten(graph: DesignTopoGraph) -> dict[str, Any]:
+    # share equal strings, pickle only write them once
+    symbols = dict[str, str]()
+
+    def sym(x: str) -> str:
+        return symbols.setdefault(x, x)
+
+    # all module nodes of the view, including nodes created by local_connect.xml
+    # which are not in graph.nodes, links out of the view are not saved
+    moduleIndex = dict[int, int]()
+    moduleList = list[ModuleNode]()
+    stack = list(graph.nodes.values())
+    while stack.__len__() > 0:
+        node = stack.pop()
+        if id(node) in moduleIndex:
+            continue
+        moduleIndex[id(node)] = moduleList.__len__()
+        moduleList.append(node)
+        stack.extend(node.next.values())
+        stack.extend(pNode for _, pNode in graph.prevOf(node))
+
+    portIndex = dict[int, int]()
+    portList = list[PortWireNode]()
+    for node in moduleList:
+        for port in node.ports.values():
+            portIndex[id(port)] = portList.__len__()
+            portList.append(port)
+
+    def links(d: dict[WireLink, PortWireNode]):
+        return [
+            (
+                sym(k.container),
+                sym(k.thisInst),
+                sym(k.thatInst),
+                sym(k.port),
+                sym(k.wire),
+                sym(k.bundle),
+                portIndex[id(v)],
+            )
+            for k, v in d.items()
+            if id(v) in portIndex
+        ]
+
+    return {
+        "modules": [
+            (
+                sym(node.name),
+                [(sym(inst), moduleIndex[id(sub)]) for inst, sub in node.next.items()],
+                [
+                    (sym(link.container), sym(link.instance), moduleIndex[id(parent)])
+                    for link, parent in graph.prevOf(node)
+                ],
+                [
+                    (sym(port.name), port.dir.value, port.range.msb, port.range.lsb)
+                    for port in node.ports.values()
+                ],
+                [
+                    (
+                        sym(net.wire),
+                        sym(net.bundle),
+                        [(sym(inst), portIndex[id(port)]) for inst, port in net.members],
+                    )
+                    for net in node.local.values()
+                ],
+                {
+                    sym(bundle): {sym(wire) for wire in wires}
+                    for bundle, wires in node.bundle2wire.items()
+                },
+                node.loaded,
+            )
+            for node in moduleList
+        ],
+        "ports": [(links(port.inner), links(port.outer)) for port in portList],
+        "nodes": [(sym(name), moduleIndex[id(node)]) for name, node in graph.nodes.items()],
+        "roots": sorted(graph.roots),
+        "inputFiles": graph.inputFiles,
+    }
+
+
+def unflatten(graph: DesignTopoGraph, tables: dict[str, Any]):
+    moduleList = [ModuleNode(x[0]) for x in tables["modules"]]
+    portList = list[PortWireNode]()
+    for node, (_, nexts, prevs, ports, _, bundle2wire, loaded) in zip(
+        moduleList, tables["modules"]
+    ):
+        for inst, sub in nexts:
+            node.next[inst] = moduleList[sub]
+        for container, inst, parent in prevs:
+            node.prev[ModuleLink(container, inst)] = moduleList[parent]
+        for name, dir, msb, lsb in ports:
+            port = PortWireNode(name, PortDir(dir), WireRange.of(msb, lsb), node)
+            node.ports[name] = port
+            portList.append(port)
+        node.bundle2wire = bundle2wire
+        node.loaded = loaded
+
+    for node, (_, _, _, _, local, _, _) in zip(moduleList, tables["modules"]):
+        for wire, bundle, members in local:
+            net = NetNode(node.name, wire, bundle)
+            for inst, port in members:
+                net.members.append((inst, portList[port]))
+                portList[port].nets.append((inst, net))
+            node.local[wire] = net
+
+    for port, (inner, outer) in zip(portList, tables["ports"]):
+        for container, thisInst, thatInst, name, wire, bundle, that in inner:
+            link = WireLink(container, thisInst, thatInst, name, wire, bundle)
+            port.inner[link] = portList[that]
+        for container, thisInst, thatInst, name, wire, bundle, that in outer:
+            link = WireLink(container, thisInst, thatInst, name, wire, bundle)
+            port.outer[link] = portList[that]
+
+    graph.nodes = {name: moduleList[index] for name, index in tables["nodes"]}
+    graph.allNodes = graph.nodes
+    graph.roots = set(tables["roots"])
+    graph.inputFiles = tables["inputFiles"]
+
+
+def saveSnapshot(graph: DesignTopoGraph, snapshotFile: str, key: str = ""):
+    """
+    key: describe how the graph is built (tops, xml dir...),
+    a snapshot is only loaded with the same key
+    """
+    graph.loadPortTopo()
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "class": type(graph),
+        "key": key,
+        "stamps": graph.inputStamps(),
+    }
+    os.makedirs(os.path.dirname(snapshotFile) or ".", exist_ok=True)
+    tmpFile = f"{snapshotFile}.tmp"
+    with stats.stage("saveSnapshot") as record, open(tmpFile, "wb") as file:
+        pickle.dump(header, file, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(flatten(graph), file, pickle.HIGHEST_PROTOCOL)
+        record.items = record.items + graph.nodes.__len__()
+    os.replace(tmpFile, snapshotFile)
+
+
+def loadSnapshot(
+    snapshotFile: str, key: str = "", inputs: list[str] | None = None
+) -> DesignTopoGraph | None:
+    """
+    inputs: files the graph must be built from, stale if any of them is not stamped
+    an unreadable snapshot is stale too
+    """
+    if not os.path.isfile(snapshotFile):
+        return None
+    with open(snapshotFile, "rb") as file:
+        try:
+            header = pickle.load(file)
+            if header["version"] != SNAPSHOT_VERSION or header["key"] != key:
+                cl.info("snapshot %s is built with other version or key", snapshotFile)
+                return None
+            stamped = {os.path.abspath(stamp.path) for stamp in header["stamps"]}
+        except UNREADABLE_ERRORS as e:
+            cl.info("snapshot %s is unreadable: %r", snapshotFile, e)
+            return None
+        for path in inputs or []:
+            if os.path.abspath(path) not in stamped:
+                cl.info("snapshot %s is not built from %s", snapshotFile, path)
+                return None
+        for stamp in header["stamps"]:
+            if stamp.isChanged():
+                cl.info("snapshot %s is stale for %s changed", snapshotFile, stamp.path)
+                return None
+        with stats.stage("loadSnapshot") as record:
+            try:
+                tables = pickle.load(file)
+            except UNREADABLE_ERRORS as e:
+                cl.info("snapshot %s is unreadable: %r", snapshotFile, e)
+                return None
+            cls: type[DesignTopoGraph] = header["class"]
+            graph = cls.__new__(cls)
+            DesignTopoGraph.__init__(graph)
+            unflatten(graph, tables)
+            record.items = record.items + graph.nodes.__len__()
+        return graph
+
+
+def loadOrBuild(
+    snapshotFile: str | None,
+    key: str,
+    build: Callable[[], G],
+    inputs: list[str] | None = None,
+) -> G:
+    """
+    load graph from snapshotFile, if missing or stale, build it and save the snapshot
+    snapshotFile: None for never use snapshot
+    key: should include the input directories, snapshots of other designs are not loaded
+    inputs: files the graph is built from, as loadSnapshot
+    """
+    if snapshotFile is None:
+        return build()
+    graph = loadSnapshot(snapshotFile, key, inputs)
+    if graph is not None:
+        return graph  # type: ignore
+    graph = build()
+    saveSnapshot(graph, snapshotFile, key)
+    return graph
@@ -0,0 +1,188 @@
+"""
+per stage timing and memory instrumentation of DesignTree
+
+variable
+stats: StageStats of this process, disabled until enable() is called
+
+class
+StageRecord: accumulated cost and item count of a named stage
+StageStats: stage timer, per container costs, json report and profiler hook
+
+usage
+with stats.stage("yaml") as record:
+    ...
+    record.items += n
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+import cProfile
+import json
+import resource
+import time
+import tracemalloc
+
+
+@dataclass
+class StageRecord:
+    """
+    name: stage names from the outermost stage, joined by "/"
+    allocated: bytes traced by tracemalloc still alive at exit, None without memory
+    peak: highest traced bytes during the stage, None without memory
+    maxRss: max RSS of the process at the last exit, in bytes
+    containers: container -> [seconds, items] of per container work in the stage
+    """
+
+    name: str
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    allocated: int | None = None
+    peak: int | None = None
+    maxRss: int = 0
+    items: int = 0
+    containers: dict[str, list[float]] = field(default_factory=dict)
+
+
+def maxRss() -> int:
+    # ru_maxrss is in KB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageStats:
+    """
+    stages can nest, a stage entered several times accumulates into one record.
+    when disabled, stage() only yields a scratch record and container() returns at once
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.memory = False
+        self.records = dict[str, StageRecord]()
+        # full names of the stages entered and not exited, the innermost last
+        self.stack = list[str]()
+        # highest traced bytes of exited inner stages, one for each entered stage
+        self.innerPeaks = list[int]()
+        self.profileName: str | None = None
+        self.profiler: cProfile.Profile | None = None
+
+    def enable(self, memory: bool = False, profileName: str | None = None):
+        """
+        memory: trace allocations by tracemalloc, it makes every stage slower
+        profileName: profile every run of the stage with this name (the last part) by cProfile
+        """
+        self.enabled = True
+        self.memory = memory
+        self.profileName = profileName
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def reset(self):
+        """
+        forget the records, between runs measured separately
+        """
+        assert self.stack.__len__() == 0
+        self.records.clear()
+        self.profiler = None
+
+    def current(self) -> StageRecord | None:
+        if not self.enabled or self.stack.__len__() == 0:
+            return None
+        return self.records[self.stack[-1]]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        if not self.enabled:
+            yield StageRecord(name)
+            return
+        path = name if self.stack.__len__() == 0 else f"{self.stack[-1]}/{name}"
+        record = self.records.get(path)
+        if record is None:
+            record = self.records[path] = StageRecord(path)
+        self.stack.append(path)
+        if self.memory:
+            allocatedBefore, peakBefore = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self.innerPeaks.append(0)
+        profiler = None
+        if name == self.profileName:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            profiler = self.profiler
+            profiler.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall = record.wall + time.perf_counter() - wall
+            record.cpu = record.cpu + time.process_time() - cpu
+            if profiler is not None:
+                profiler.disable()
+            if self.memory:
+                allocated, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, self.innerPeaks.pop())
+                record.allocated = (record.allocated or 0) + allocated - allocatedBefore
+                record.peak = max(record.peak or 0, peak)
+                # the peak of the outer stage before this stage is lost by reset_peak
+                if self.innerPeaks.__len__() > 0:
+                    self.innerPeaks[-1] = max(self.innerPeaks[-1], peakBefore, peak)
+            record.calls = record.calls + 1
+            record.maxRss = maxRss()
+            self.stack.pop()
+
+    def clock(self) -> float:
+        """
+        start time of container(), 0 when disabled
+        """
+        return time.perf_counter() if self.enabled else 0.0
+
+    def container(self, name: str, start: float, items: int = 0, seconds: float | None = None):
+        """
+        add the cost of container name to the current stage,
+        seconds since start (from clock()) if seconds is None
+        """
+        record = self.current()
+        if record is None:
+            return
+        if seconds is None:
+            seconds = time.perf_counter() - start
+        cost = record.containers.setdefault(name, [0.0, 0])
+        cost[0] = cost[0] + seconds
+        cost[1] = cost[1] + items
+
+    def report(self) -> dict[str, Any]:
+        stages = list[dict[str, Any]]()
+        for record in self.records.values():
+            # the slowest containers first
+            containers = sorted(record.containers.items(), key=lambda x: -x[1][0])
+            stages.append(
+                {
+                    "name": record.name,
+                    "calls": record.calls,
+                    "wall": record.wall,
+                    "cpu": record.cpu,
+                    "allocated": record.allocated,
+                    "peak": record.peak,
+                    "maxRss": record.maxRss,
+                    "items": record.items,
+                    "containers": [
+                        {"name": name, "wall": cost[0], "items": cost[1]}
+                        for name, cost in containers
+                    ],
+                }
+            )
+        return {"maxRss": maxRss(), "stages": stages}
+
+    def write(self, jsonFile: str):
+        """
+        write report() to jsonFile, and the profile of the profiled stage
+        to jsonFile with suffix .<stage>.prof, readable by pstats
+        """
+        with open(jsonFile, "w", encoding="utf-8") as file:
+            json.dump(self.report(), file, indent=2)
+        if self.profiler is not None:
+            self.profiler.dump_stats(f"{jsonFile}.{self.profileName}.prof")
+
+
+stats = StageStats()
@@ -2,17 +2,31 @@
 utils and basic class used in DesignTree
 
 variable
-cl: for logging information about DesignTree
+cl: for logging information about DesignTree, only errors are handled until setupLogging
+diag: warnings of noisy inputs, counted in memory and logged once by diag.flush
+
+function
+setupLogging: log to DesignTree.log and console, called by entry scripts
 
 class
 HierInstPath: present module and instances hierarchy
 PortDir: present the direct of wire or bundle
+FileStamp: size, mtime and content hash of an input file
+StampedReader: read a file for parsing and take its FileStamp at once
+Diagnostics: count warnings by category, keep the first samples of each category
 """
 
 from enum import Enum
+from array import array
+import atexit
+import hashlib
+import io
 import logging
-from typing import Dict, Set, TypeVar
-from dataclasses import dataclass
+import os
+import sys
+import threading
+from typing import Any, Dict, Set, TypeVar
+from dataclasses import dataclass, FrozenInstanceError
 
 class ErrorRaisingHandler(logging.Handler):
     def emit(self, record: logging.LogRecord) -> None:
@@ -25,35 +39,162 @@ class CondLogger(logging.Logger):
             self.warning(msg)
 
 
-# 控制台
-consoleHandler = logging.StreamHandler()
-consoleHandler.setLevel(logging.ERROR)
-
-# 文件输出
-fileHandler = logging.FileHandler("DesignTree.log", "w")
-fileHandler.setLevel(logging.DEBUG)
-
-formatter = logging.Formatter("%(levelname)s: %(message)s")
-consoleHandler.setFormatter(formatter)
-fileHandler.setFormatter(formatter)
-
 errorHandler = ErrorRaisingHandler()
 errorHandler.setLevel(logging.ERROR)
 
 # 创建 Logger
 logging.setLoggerClass(CondLogger)
 logger = logging.getLogger("DesignTree")
-# 添加 Handler
+# 添加 Handler, error is raised as RuntimeError even without setupLogging
 logger.setLevel(logging.DEBUG)
-logger.addHandler(consoleHandler)
-logger.addHandler(fileHandler)
+logger.addHandler(logging.NullHandler())
 logger.addHandler(errorHandler)
 
 assert isinstance(logger, CondLogger)
 cl: CondLogger = logger
 
 
-@dataclass(frozen=True)
+# setupLogging is done, later calls of other entry scripts in the process do nothing
+loggingReady = False
+
+
+def setupLogging(logFile: str = "DesignTree.log", consoleLevel: int = logging.ERROR):
+    """
+    log everything to logFile and consoleLevel and above to console,
+    diag is flushed at exit, even if the run fails.
+    only the first call in a process sets them up
+    """
+    global loggingReady
+    if loggingReady:
+        return
+    loggingReady = True
+    # 控制台
+    consoleHandler = logging.StreamHandler()
+    consoleHandler.setLevel(consoleLevel)
+
+    # 文件输出
+    fileHandler = logging.FileHandler(logFile, "w")
+    fileHandler.setLevel(logging.DEBUG)
+
+    formatter = logging.Formatter("%(levelname)s: %(message)s")
+    consoleHandler.setFormatter(formatter)
+    fileHandler.setFormatter(formatter)
+
+    # errorHandler raises, it must be the last handler so errors are logged before
+    cl.removeHandler(errorHandler)
+    cl.addHandler(consoleHandler)
+    cl.addHandler(fileHandler)
+    cl.addHandler(errorHandler)
+    # registered after logging, so it runs before logging.shutdown closes the handlers
+    atexit.register(diag.flush)
+
+
+class Diagnostics:
+    """
+    warnings of hot loops, instead of one log record per occurrence.
+    warn only counts the category and keeps the arguments of its first samples,
+    messages are formatted by flush, which logs one summary of all categories
+    """
+
+    def __init__(self, samples: int = 10) -> None:
+        self.samples = samples
+        # category -> (format of message, number of occurrences, args of the first samples)
+        self.categories = dict[str, tuple[str, list[int], list[tuple[Any, ...]]]]()
+
+    def warn(self, category: str, fmt: str, *args: Any):
+        entry = self.categories.get(category)
+        if entry is None:
+            entry = self.categories.setdefault(category, (fmt, [0], []))
+        entry[1][0] = entry[1][0] + 1
+        if entry[2].__len__() < self.samples:
+            entry[2].append(args)
+
+    def count(self, category: str) -> int:
+        entry = self.categories.get(category)
+        return 0 if entry is None else entry[1][0]
+
+    def summary(self) -> str:
+        lines = list[str]()
+        for category, (fmt, count, samples) in self.categories.items():
+            lines.append(f"{category}: {count[0]} times")
+            lines.extend(f"    {fmt % args}" for args in samples)
+            if count[0] > samples.__len__():
+                lines.append(f"    ... {count[0] - samples.__len__()} more")
+        return "\n".join(lines)
+
+    def flush(self):
+        """
+        log the summary as one warning and forget all categories
+        """
+        if self.categories.__len__() == 0:
+            return
+        cl.warning("diagnostics summary\n%s", self.summary())
+        self.categories.clear()
+
+
+diag = Diagnostics()
+
+
+class InstPathTable:
+    """
+    trie of interned instance names, an instance path is a node id of the trie
+
+    node 0 is the empty path, every other node is (parent node, instance name),
+    so equal paths share one node and extending a path by one instance is O(1)
+    """
+
+    def __init__(self) -> None:
+        self.parents = array("q", [0])
+        self.depths = array("q", [0])
+        self.names = [""]
+        # (parent node, instance name) -> node
+        self.children = dict[tuple[int, str], int]()
+        # only new nodes are locked, lookup is lock free
+        self.lock = threading.Lock()
+
+    def child(self, node: int, name: str) -> int:
+        key = (node, name)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.get(key)
+                if child is None:
+                    child = self.names.__len__()
+                    self.parents.append(node)
+                    self.depths.append(self.depths[node] + 1)
+                    self.names.append(sys.intern(name))
+                    self.children[key] = child
+        return child
+
+    def find(self, node: int, name: str) -> int | None:
+        """
+        child of node without creating it, None if not exist
+        """
+        return self.children.get((node, name))
+
+    def fromTuple(self, instances: tuple[str, ...]) -> int:
+        node = 0
+        for name in instances:
+            node = self.child(node, name)
+        return node
+
+    def toTuple(self, node: int) -> tuple[str, ...]:
+        res = [""] * self.depths[node]
+        for idx in range(res.__len__() - 1, -1, -1):
+            res[idx] = self.names[node]
+            node = self.parents[node]
+        return tuple(res)
+
+    def concat(self, node: int, tail: int) -> int:
+        for name in self.toTuple(tail):
+            node = self.child(node, name)
+        return node
+
+
+# shared by all HierInstPath
+instPathTable = InstPathTable()
+
+
 class HierInstPath:
     """
     representing module and instances hierarchy
@@ -63,27 +204,60 @@ class HierInstPath:
     self.instances: instance name path under this module
     If you want to add or sub the HierInstPath, it need the module and instance path information.
     please use DesignManager.add/sub to process two HierInstPath.
+
+    instances are stored as a node of instPathTable,
+    the tuple of instance names is only built when self.instances or self.join is used
     """
 
+    __slots__ = ("module", "node")
     module: str
-    instances: tuple[str, ...]
+    node: int
+
+    def __init__(self, module: str, instances: tuple[str, ...]) -> None:
+        object.__setattr__(self, "module", module)
+        object.__setattr__(self, "node", instPathTable.fromTuple(instances))
+
+    @staticmethod
+    def fromNode(module: str, node: int) -> "HierInstPath":
+        path = object.__new__(HierInstPath)
+        object.__setattr__(path, "module", module)
+        object.__setattr__(path, "node", node)
+        return path
 
     @staticmethod
     def fromStr(moduleName: str, path: str) -> "HierInstPath":
         return HierInstPath(moduleName, tuple(path.split(".")))
 
+    @property
+    def instances(self) -> tuple[str, ...]:
+        return instPathTable.toTuple(self.node)
+
+    def depth(self) -> int:
+        return instPathTable.depths[self.node]
+
     def join(self, split: str) -> str:
         return split.join((self.module,) + self.instances)
 
     def parent(self) -> "HierInstPath":
-        assert self.instances.__len__() > 0
-        return HierInstPath(self.module, self.instances[:-1])
+        assert self.depth() > 0
+        return HierInstPath.fromNode(self.module, instPathTable.parents[self.node])
 
     def leaf(self) -> str:
-        return self.instances[-1]
+        assert self.depth() > 0
+        return instPathTable.names[self.node]
 
     def addInst(self, that: str):
-        return HierInstPath(self.module, self.instances + (that,))
+        return HierInstPath.fromNode(self.module, instPathTable.child(self.node, that))
+
+    def concat(self, that: "HierInstPath") -> "HierInstPath":
+        """
+        append instances of that to self, ignore module of that
+        """
+        if that.node == 0:
+            return self
+        return HierInstPath.fromNode(
+            self.module, instPathTable.concat(self.node, that.node)
+        )
 
     def common(self, that: "HierInstPath"):
         if self.module != that.module:
@@ -100,6 +274,27 @@ class HierInstPath:
     def empty() -> "HierInstPath":
         return HierInstPath("", ())
 
+    def __eq__(self, that: object) -> bool:
+        if not isinstance(that, HierInstPath):
+            return NotImplemented
+        return self.node == that.node and self.module == that.module
+
+    def __hash__(self) -> int:
+        return hash((self.module, self.node))
+
+    def __repr__(self) -> str:
+        return f"HierInstPath(module={self.module!r}, instances={self.instances!r})"
+
+    def __setattr__(self, name: str, value) -> None:
+        raise FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name: str) -> None:
+        raise FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def __reduce__(self):
+        # node id is only valid in this process
+        return (HierInstPath, (self.module, self.instances))
+
 
 class PortDir(Enum):
     """
@@ -128,11 +323,118 @@ class PortDir(Enum):
         assert False, f"Direct str {dir} is not expected"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class WireRange:
+    """
+    use WireRange.of to share equal ranges, most wires have only a few kinds of range
+    """
+
     msb: int
     lsb: int
 
+    @staticmethod
+    def of(msb: int, lsb: int) -> "WireRange":
+        key = (msb, lsb)
+        wireRange = wireRanges.get(key)
+        if wireRange is None:
+            wireRange = wireRanges.setdefault(key, WireRange(msb, lsb))
+        return wireRange
+
+
+# (msb, lsb) -> shared WireRange
+wireRanges = dict[tuple[int, int], WireRange]()
+
+
+@dataclass(frozen=True)
+class FileStamp:
+    """
+    fingerprint of an input file, to check whether the file is changed
+    """
+
+    path: str
+    size: int
+    mtime: int  # st_mtime_ns
+    digest: str
+
+    @staticmethod
+    def hashFile(path: str) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as file:
+            while True:
+                block = file.read(1 << 20)
+                if not block:
+                    break
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def of(path: str) -> "FileStamp":
+        stat = os.stat(path)
+        return FileStamp(path, stat.st_size, stat.st_mtime_ns, FileStamp.hashFile(path))
+
+    def isChanged(self) -> bool:
+        """
+        size differs: changed; size and mtime are the same: not changed;
+        only mtime differs (file touched): compare content hash
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        if stat.st_size != self.size:
+            return True
+        if stat.st_mtime_ns == self.mtime:
+            return False
+        return FileStamp.hashFile(self.path) != self.digest
+
+
+class StampedReader(io.RawIOBase):
+    """
+    binary reader of a file for parsers, hashes the bytes as they are read,
+    so a file is read once for both parsing and its FileStamp
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self.file = open(path, "rb")
+        # stat before reading, a change while reading makes the stamp stale
+        stat = os.fstat(self.file.fileno())
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        self.hash = hashlib.blake2b(digest_size=16)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        count = self.file.readinto(buffer)
+        self.hash.update(memoryview(buffer)[:count])
+        return count
+
+    def read(self, size: int = -1) -> bytes:
+        block = self.file.read(size)
+        self.hash.update(block)
+        return block
+
+    def stamp(self) -> FileStamp:
+        """
+        stamp of the content read, the rest not read by the parser is hashed here
+        """
+        while True:
+            block = self.read(1 << 20)
+            if not block:
+                break
+        return FileStamp(self.path, self.size, self.mtime, self.hash.hexdigest())
+
+    def close(self) -> None:
+        self.file.close()
+        super().close()
+
+    def __enter__(self) -> "StampedReader":
+        return self
+
+
 K = TypeVar("K")  # 泛型键类型
 V = TypeVar("V")  # 泛型值类型
 
@@ -1,6 +1,11 @@
-from .Utils import PortDir, HierInstPath
+from .Utils import PortDir, HierInstPath, diag, setupLogging
 from .Node import PortWireNode
 from .LogicalAndTile import LogicalTopoGraph, TileTopoGraph, LogicalTileMap
+from .Snapshot import saveSnapshot, loadSnapshot, loadOrBuild
+from .Query import LeafPortQuery
+from .NetIndex import NetIndex, NetId
+from .MultiDrive import MultiDriveChecker, MultiDriveNet
+from .Stats import StageStats, stats
 
 __all__ = [
     "HierInstPath",
@@ -9,4 +14,16 @@ __all__ = [
     "TileTopoGraph",
     "PortWireNode",
     "LogicalTileMap",
+    "LeafPortQuery",
+    "NetIndex",
+    "NetId",
+    "MultiDriveChecker",
+    "MultiDriveNet",
+    "saveSnapshot",
+    "loadSnapshot",
+    "loadOrBuild",
+    "StageStats",
+    "stats",
+    "diag",
+    "setupLogging",
 ]
@@ -1,21 +1,115 @@
-from DesignTree import LogicalTopoGraph, TileTopoGraph, LogicalTileMap
+from DesignTree import LogicalTopoGraph, TileTopoGraph, LogicalTileMap, loadOrBuild, stats
+from DesignTree import setupLogging
+import argparse
+import os
 import sys
 
 
-def main():
-    lgclDir: str = sys.argv[1]
-    tileDir: str = sys.argv[2]
-    topName: str = sys.argv[3]
-    # create logical view
+def buildLgclView(lgclDir: str, topName: str) -> LogicalTopoGraph:
     lgclView = LogicalTopoGraph(f"{lgclDir}/logical_info.yml")
-    success = lgclView.tops({topName})
+    with stats.stage("lgclTops") as record:
+        success = lgclView.tops({topName})
+        record.items = record.items + lgclView.nodes.__len__()
     assert success == {topName}
-    # create tile view
+    return lgclView
+
+
+def buildTileView(tileDir: str, topName: str) -> TileTopoGraph:
     tileView = TileTopoGraph(f"{tileDir}/tile_info.yml")
-    tileView.tops({topName})
+    with stats.stage("tileTops") as record:
+        success = tileView.tops({topName})
+        record.items = record.items + tileView.nodes.__len__()
     assert success == {topName}
+    return tileView
+
+
+def translateFile(tileMap: LogicalTileMap, pathFile: str, outFile: str, toTile: bool):
+    """
+    write "path -> translated path" of each path in pathFile,
+    return the number of paths not under a map line
+    """
+    missed = 0
+    with open(pathFile, "r", encoding="utf-8") as src, open(
+        outFile, "w", encoding="utf-8"
+    ) as dst:
+        while True:
+            lines = src.readlines(1 << 24)
+            if lines.__len__() == 0:
+                break
+            out = list[str]()
+            paths = (line.strip() for line in lines if not line.isspace())
+            for path, translated in tileMap.translateAll(paths, toTile):
+                if translated is None:
+                    missed = missed + 1
+                else:
+                    out.append(f"{path} -> {translated}\n")
+            dst.write("".join(out))
+    return missed
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("lgclDir")
+    argParser.add_argument("tileDir")
+    argParser.add_argument("topName")
+    argParser.add_argument(
+        "--snapshot-dir", help="directory of design graph snapshots, reused if inputs are unchanged"
+    )
+    argParser.add_argument(
+        "--workers", type=int, default=1, help="processes checking map lines"
+    )
+    argParser.add_argument(
+        "--translate", help="file of logical instance or port paths to translate to tile"
+    )
+    argParser.add_argument(
+        "--to-logical", action="store_true", help="translate tile paths to logical"
+    )
+    argParser.add_argument("--output", default="translated.txt")
+    argParser.add_argument(
+        "--stats", help="write time, memory and item count of each stage to this json file"
+    )
+    argParser.add_argument(
+        "--stats-memory", action="store_true", help="trace memory of stages, slower"
+    )
+    argParser.add_argument(
+        "--profile-stage", help="profile the stage of this name, written next to --stats"
+    )
+    args = argParser.parse_args()
+    setupLogging()
+    if args.stats is not None:
+        stats.enable(args.stats_memory, args.profile_stage)
+    lgclDir: str = args.lgclDir
+    tileDir: str = args.tileDir
+    topName: str = args.topName
+    snapshotDir: str | None = args.snapshot_dir
+    # create logical view
+    lgclView = loadOrBuild(
+        None if snapshotDir is None else f"{snapshotDir}/logical.snapshot",
+        f"tops={topName}:dir={os.path.abspath(lgclDir)}",
+        lambda: buildLgclView(lgclDir, topName),
+        [f"{lgclDir}/logical_info.yml"],
+    )
+    # create tile view
+    tileView = loadOrBuild(
+        None if snapshotDir is None else f"{snapshotDir}/tile.snapshot",
+        f"tops={topName}:dir={os.path.abspath(tileDir)}",
+        lambda: buildTileView(tileDir, topName),
+        [f"{tileDir}/tile_info.yml"],
+    )
 
-    LogicalTileMap(f"{tileDir}/logical2tile_hierarchy.map", topName, lgclView, tileView)
+    tileMap = LogicalTileMap(
+        f"{tileDir}/logical2tile_hierarchy.map", topName, lgclView, tileView, args.workers
+    )
+    if args.translate is not None:
+        with stats.stage("translate"):
+            missed = translateFile(tileMap, args.translate, args.output, not args.to_logical)
+        if missed > 0:
+            print(f"{missed} paths are not under any map line", file=sys.stderr)
+    if args.stats is not None:
+        stats.write(args.stats)
+    if tileMap.mismatches.__len__() > 0:
+        print(tileMap.report())
+        sys.exit(1)
 
     # lgclView.createPortTopo(lgclDir)
     # tileView.createPortTopo(tileDir)
@@ -1,113 +1,334 @@
-import sys
-from DesignTree import HierInstPath, LogicalTopoGraph, PortWireNode
+import argparse
+from DesignTree import HierInstPath, LogicalTopoGraph, PortWireNode, LeafPortQuery
+from DesignTree import MultiDriveChecker, NetIndex, loadOrBuild, stats
+from DesignTree import setupLogging
+from multiprocessing import Pool
+from typing import Iterable, Iterator, Protocol, TypeAlias
+import mmap
+import os
 import re
+import sys
+
+# (container, bundle, [(instance name, port name, direct)])
+LogRecord: TypeAlias = tuple[str, str, list[tuple[str, str, str]]]
+
+
+class ByteSource(Protocol):
+    """
+    the log file or its mmap
+    """
+
+    def seek(self, pos: int, /) -> object: ...
+
+    def read(self, size: int = -1, /) -> bytes: ...
 
 
 class InputParser:
-    portPattern = r"\"(\w+):(\w+):(receive|transmit)\""
-    containerPattern = r"blkclass:(\w+) hier:(\w+)"
-    bundlePattern = r"ERROR:  inst:(\w+)\("
-
-    def __init__(self, fileName: str) -> None:
-        self.file = open(fileName, "r", encoding="utf-8")
-        self.hier = str()
-        self.container = str()
-        self.bundle = str()
-        self.items: list[tuple[str, str, str]] = []
-
-    def getContainer(self) -> str:
-        return self.container
-
-    def getBundle(self) -> str:
-        return self.bundle
-
-    def nextItem(self) -> tuple[str, str, str] | None:
-        if self.items.__len__() == 0:
-            return None
-        item = self.items[0]
-        self.items.pop(0)
-        return item
-
-    def readLine(self) -> bool:
-        line = self.file.readline()
-        if not line:
-            self.file.close()
-            return False
+    """
+    streaming parser of multidrive log, yield a LogRecord for each line
+
+    the log is read in large blocks (or through mmap),
+    and can be split to line aligned chunks which are parsed by several processes
+    """
 
+    portPattern = re.compile(rb"\"(\w+):(\w+):(receive|transmit)\"")
+    containerPattern = re.compile(rb"blkclass:(\w+) hier:(\w+)")
+    bundlePattern = re.compile(rb"ERROR:  inst:(\w+)\(")
+    blockSize = 1 << 24
+
+    def __init__(self, fileName: str, useMmap: bool = False) -> None:
+        self.fileName = fileName
+        self.useMmap = useMmap
+
+    @staticmethod
+    def parseLine(line: bytes) -> LogRecord:
         # parser "blkClass:foo hier:bar.foo"
-        match = re.search(InputParser.containerPattern, line)
-        assert match is not None
-        self.container = match.group(1)
+        match = InputParser.containerPattern.search(line)
+        assert match is not None, f"no container in {line!r}"
+        container = match.group(1).decode()
 
         # parser "inst:bundleName"
-        match = re.search(InputParser.bundlePattern, line)
-        assert match is not None
-        self.bundle = match.group(1)
+        match = InputParser.bundlePattern.search(line)
+        assert match is not None, f"no bundle in {line!r}"
+        bundle = match.group(1).decode()
 
         # parser "zsc:ZSC_USB_CG_ctrl:transmit"
-        matches = re.findall(InputParser.portPattern, line)
-        for match in matches:
-            instName = match[0]
-            portName = match[1]
-            dir = match[2]
-            assert isinstance(instName, str)
-            assert isinstance(portName, str)
-            assert isinstance(dir, str)
-            self.items.append((instName, portName, dir))
-        return True
+        items = [
+            (instName.decode(), portName.decode(), dir.decode())
+            for instName, portName, dir in InputParser.portPattern.findall(line)
+        ]
+        return (container, bundle, items)
+
+    def lines(self, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        """
+        lines in bytes [start, end) of the log, start and end should be line aligned
+        """
+        with open(self.fileName, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            end = size if end is None else min(end, size)
+            if end <= start:
+                return
+            mapped = None
+            if self.useMmap:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            # the mmap is closed even if the caller stops iterating early
+            try:
+                source: ByteSource = file if mapped is None else mapped
+                source.seek(start)
+                remain = end - start
+                rest = b""
+                while remain > 0:
+                    block = source.read(min(InputParser.blockSize, remain))
+                    if not block:
+                        break
+                    remain = remain - block.__len__()
+                    lines = (rest + block).split(b"\n")
+                    rest = lines.pop()
+                    yield from lines
+                if rest:
+                    yield rest
+            finally:
+                if mapped is not None:
+                    mapped.close()
+
+    def records(self, start: int = 0, end: int | None = None) -> Iterator[LogRecord]:
+        for line in self.lines(start, end):
+            if line.strip():
+                yield InputParser.parseLine(line)
+
+    def chunks(self, count: int) -> list[tuple[int, int]]:
+        """
+        split the log to count line aligned chunks [start, end)
+        """
+        size = os.path.getsize(self.fileName)
+        bounds = [0]
+        with open(self.fileName, "rb") as file:
+            for idx in range(1, count):
+                pos = max(size * idx // count, bounds[-1])
+                file.seek(pos)
+                if pos > 0:
+                    file.readline()  # move to the start of next line
+                bounds.append(min(file.tell(), size))
+        bounds.append(size)
+        return [(bounds[i], bounds[i + 1]) for i in range(count) if bounds[i] < bounds[i + 1]]
+
+    def parallelRecords(self, workers: int) -> Iterator[LogRecord]:
+        """
+        records in the order of the log, chunks are parsed by workers processes
+        """
+        if workers <= 1:
+            yield from self.records()
+            return
+        tasks = [
+            (self.fileName, self.useMmap, start, end)
+            for start, end in self.chunks(workers * 4)
+        ]
+        with Pool(workers) as pool:
+            for records in pool.imap(parseChunk, tasks):
+                yield from records
+
 
+def parseChunk(task: tuple[str, bool, int, int]) -> list[LogRecord]:
+    fileName, useMmap, start, end = task
+    return list(InputParser(fileName, useMmap).records(start, end))
 
-def format(instPath: HierInstPath, portName: str) -> str:
-    instPathStr = instPath.join("/")
-    return f"{instPathStr}/{portName}\n"
 
-outputs = open("outputs.txt", "w")
+class LeafPortWriter:
+    """
+    write "instPath/port[bit]" lines of leaf ports
 
+    every absolute path is joined once for all bits of a port,
+    lines are buffered and written in large batches
+    compact: write one "instPath/port[msb:lsb]" line instead of every bit
+    """
 
-def printLeafPortOf(
-    instPath: HierInstPath,
-    portNode: PortWireNode,
-    hierTree: LogicalTopoGraph,
-):
-    for absPath in hierTree.outer(instPath):
-        if portNode.range.msb - portNode.range.lsb == 0:
-            outputs.write(format(absPath, portNode.name))
+    def __init__(self, fileName: str, compact: bool = False, bufferSize: int = 1 << 20):
+        self.file = open(fileName, "w", encoding="utf-8")
+        self.compact = compact
+        self.bufferSize = bufferSize
+        self.buffer = list[str]()
+        self.bufferLen = 0
+        # port node -> "/port[bit]" of each bit
+        self.bitsCache = dict[PortWireNode, list[str]]()
+
+    def bitsOf(self, portNode: PortWireNode) -> list[str]:
+        bits = self.bitsCache.get(portNode)
+        if bits is not None:
+            return bits
+        msb, lsb = portNode.range.msb, portNode.range.lsb
+        if msb - lsb == 0:
+            bits = [f"/{portNode.name}"]
+        elif self.compact:
+            bits = [f"/{portNode.name}[{msb}:{lsb}]"]
         else:
-            for i in range(portNode.range.lsb, portNode.range.msb + 1):
-                outputs.write(format(absPath, f"{portNode.name}[{i}]"))
+            bits = [f"/{portNode.name}[{i}]" for i in range(lsb, msb + 1)]
+        self.bitsCache[portNode] = bits
+        return bits
 
+    def write(self, absPath: HierInstPath, portNode: PortWireNode):
+        prefix = absPath.join("/")
+        chunk = prefix + f"\n{prefix}".join(self.bitsOf(portNode)) + "\n"
+        self.buffer.append(chunk)
+        self.bufferLen = self.bufferLen + chunk.__len__()
+        if self.bufferLen >= self.bufferSize:
+            self.flush()
 
-def main():
-    multidriveLog: str = sys.argv[1]
-    xmlDir: str = sys.argv[2]
-    yamlFile: str = f"{xmlDir}/logical_info.yml"
-    inputParser = InputParser(multidriveLog)
-    hierTree = LogicalTopoGraph(yamlFile)
-    success = hierTree.tops({"mpu"})
+    def flush(self):
+        self.file.write("".join(self.buffer))
+        self.buffer.clear()
+        self.bufferLen = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def chooseCompact(
+    argParser: argparse.ArgumentParser,
+    leafCounts: Iterable[tuple[int, PortWireNode]],
+    maxLines: int,
+    compact: bool,
+) -> bool:
+    """
+    leafCounts: (number of absolute paths, leaf port node) of leaf ports to write
+    return whether to write compact output, exit if even compact output exceeds maxLines
+    """
+    bitLines, portLines = 0, 0
+    for count, portNode in leafCounts:
+        bitLines = bitLines + count * (portNode.range.msb - portNode.range.lsb + 1)
+        portLines = portLines + count
+    if portLines > maxLines:
+        argParser.error(f"output has up to {portLines} lines, more than --max-lines")
+    if not compact and bitLines > maxLines:
+        print(f"output has up to {bitLines} bit lines, write compact output", file=sys.stderr)
+        return True
+    return compact
+
+
+def buildHierTree(xmlDir: str, workers: int, lazy: bool, stream: bool) -> LogicalTopoGraph:
+    hierTree = LogicalTopoGraph(f"{xmlDir}/logical_info.yml")
+    with stats.stage("tops") as record:
+        success = hierTree.tops({"mpu"})
+        record.items = record.items + hierTree.nodes.__len__()
     assert success == {"mpu"}
-    hierTree.createPortTopo(xmlDir)
-    while inputParser.readLine():
-        container = inputParser.getContainer()
-        bundle = inputParser.getBundle()
-        moduleNode = hierTree.nodes[container]
-        assert moduleNode is not None
-        nodeOfModulePort = moduleNode.portOf(bundle)
-        assert nodeOfModulePort is not None
-
-        nodeOfLocalConnect = moduleNode.localOf(bundle)
-        assert nodeOfLocalConnect is not None
-
-        for node in nodeOfModulePort:
-            res = node.leaves(HierInstPath(container, ()))
-            for leafInstPath, leafNode in res:
-                printLeafPortOf(leafInstPath, leafNode, hierTree)
-
-        for instName, node in nodeOfLocalConnect:
-            res = node.leaves(HierInstPath(container, (instName,)))
-            for leafInstPath, leafNode in res:
-                printLeafPortOf(leafInstPath, leafNode, hierTree)
-
-    outputs.close()
+    hierTree.createPortTopo(xmlDir, stream=stream, workers=workers, lazy=lazy)
+    return hierTree
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("multidriveLog", nargs="?")
+    argParser.add_argument("xmlDir")
+    argParser.add_argument(
+        "--snapshot", help="snapshot file of the design graph, reused if inputs are unchanged"
+    )
+    argParser.add_argument("--output", default="outputs.txt")
+    argParser.add_argument(
+        "--workers", type=int, default=1, help="processes parsing xml and multidrive log"
+    )
+    argParser.add_argument(
+        "--stream",
+        action="store_true",
+        help="parse xml incrementally instead of building the whole DOM, workers always do",
+    )
+    argParser.add_argument("--mmap", action="store_true", help="read multidrive log by mmap")
+    argParser.add_argument(
+        "--compact", action="store_true", help="write port[msb:lsb] instead of every bit"
+    )
+    argParser.add_argument(
+        "--native",
+        action="store_true",
+        help="find multi-driven nets in the port topology instead of reading multidriveLog",
+    )
+    argParser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="parse xml of a container only when the log reaches it, not with --snapshot",
+    )
+    argParser.add_argument(
+        "--max-lines",
+        type=int,
+        help="write compact output if the output would be longer, refuse if still longer",
+    )
+    argParser.add_argument(
+        "--stats", help="write time, memory and item count of each stage to this json file"
+    )
+    argParser.add_argument(
+        "--stats-memory", action="store_true", help="trace memory of stages, slower"
+    )
+    argParser.add_argument(
+        "--profile-stage", help="profile the stage of this name, written next to --stats"
+    )
+    args = argParser.parse_args()
+    if not args.native and args.multidriveLog is None:
+        argParser.error("multidriveLog is required without --native")
+    if args.lazy and args.snapshot is not None:
+        # a snapshot holds every container, it is loaded fully anyway
+        argParser.error("--lazy is not allowed with --snapshot")
+    setupLogging()
+    if args.stats is not None:
+        stats.enable(args.stats_memory, args.profile_stage)
+    run(argParser, args)
+    if args.stats is not None:
+        stats.write(args.stats)
+
+
+def run(argParser: argparse.ArgumentParser, args: argparse.Namespace):
+    xmlDir: str = args.xmlDir
+    hierTree = loadOrBuild(
+        args.snapshot,
+        f"tops=mpu:xml={os.path.abspath(xmlDir)}",
+        lambda: buildHierTree(xmlDir, args.workers, args.lazy, args.stream),
+        [f"{xmlDir}/logical_info.yml"],
+    )
+    compact: bool = args.compact
+
+    if args.native:
+        with stats.stage("netIndex"):
+            netIndex = NetIndex(hierTree)
+        with stats.stage("multiDrive") as record:
+            checker = MultiDriveChecker(netIndex)
+            multiDriveNets = checker.check()
+            record.items = record.items + multiDriveNets.__len__()
+        if args.max_lines is not None:
+            leafCounts = (
+                (checker.countInstances(multiDriveNet), leafNode)
+                for multiDriveNet in multiDriveNets
+                for _, leafNode in multiDriveNet.leaves
+            )
+            compact = chooseCompact(argParser, leafCounts, args.max_lines, compact)
+        with stats.stage("writeOutput") as record:
+            writer = LeafPortWriter(args.output, compact)
+            for multiDriveNet in multiDriveNets:
+                for absPath, leafNode in checker.absoluteLeaves(multiDriveNet):
+                    writer.write(absPath, leafNode)
+                    record.items = record.items + 1
+            writer.close()
+        return
+
+    inputParser = InputParser(args.multidriveLog, args.mmap)
+    query = LeafPortQuery(hierTree)
+    with stats.stage("readLog") as record:
+        records = inputParser.parallelRecords(args.workers)
+        # distinct requests, in the order of first appearance
+        requests = list(dict.fromkeys((container, bundle) for container, bundle, _ in records))
+        record.items = record.items + requests.__len__()
+    if args.max_lines is not None:
+        # an upper bound, leaf ports of different requests may be the same
+        leafCounts = (
+            (hierTree.countOf(container).occurrences, leafNode)
+            for container, bundle in requests
+            for _, leafNode in query.bundleLeaves(container, bundle)
+        )
+        compact = chooseCompact(argParser, leafCounts, args.max_lines, compact)
+    with stats.stage("writeOutput") as record:
+        writer = LeafPortWriter(args.output, compact)
+        # each absolute leaf port is written once, however many lines report it
+        for absPath, leafNode in query.absoluteLeaves(requests):
+            writer.write(absPath, leafNode)
+            record.items = record.items + 1
+
+        writer.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+"""
+resident query server, the design is loaded once and queried by JSON lines
+
+python3.10 QueryServer.py lgclDir tileDir topName [--socket path] [--threads N]
+    [--workers N] [--snapshot-dir dir]
+
+lgclDir has logical_info.yml and the xml of containers, tileDir has tile_info.yml
+and logical2tile_hierarchy.map, as MultiDriverTracer and LogicalTileMapper.
+requests are read from stdin and responses written to stdout,
+or from every connection of the unix socket with --socket.
+requests are handled by a pool of threads, responses may be out of order, match them by id
+
+request
+{"id": 1, "op": "leafPorts", "container": "c", "bundle": "b", "limit": 10000}
+{"id": 2, "op": "instances", "module": "m", "limit": 10000}
+{"id": 3, "op": "translate", "path": "chip.mpu.u0.port", "toLogical": false}
+{"id": 4, "op": "stats"}
+response
+{"id": 1, "ok": true, "result": ..., "ms": 0.12}
+{"id": 1, "ok": false, "error": "...", "ms": 0.01}
+"""
+
+from DesignTree import HierInstPath, LogicalTopoGraph, TileTopoGraph, LogicalTileMap
+from DesignTree import LeafPortQuery, loadOrBuild, diag, setupLogging
+from DesignTree.Utils import cl
+from LogicalTileMapper import buildLgclView, buildTileView
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+DEFAULT_LIMIT = 10000
+
+
+class QueryServer:
+    """
+    answer requests on loaded views, safe to call handle from several threads:
+    caches of the views are filled before serving or only add complete entries
+    """
+
+    def __init__(
+        self, lgclView: LogicalTopoGraph, tileView: TileTopoGraph, tileMap: LogicalTileMap
+    ) -> None:
+        self.lgclView = lgclView
+        self.tileView = tileView
+        self.tileMap = tileMap
+        self.query = LeafPortQuery(lgclView)
+        self.handlers: dict[str, Callable[[dict[str, Any]], Any]] = {
+            "leafPorts": self.leafPorts,
+            "instances": self.instances,
+            "translate": self.translate,
+            "stats": self.stats,
+        }
+        # op -> [requests, total seconds, max seconds]
+        self.latency = dict[str, list[float]]()
+        self.lock = threading.Lock()
+        # instance counts of all modules are computed at once, not by concurrent requests
+        for root in lgclView.roots:
+            lgclView.countOf(root)
+        for root in tileView.roots:
+            tileView.countOf(root)
+
+    def handle(self, line: str) -> str:
+        start = time.perf_counter()
+        requestId, op = None, "invalid"
+        try:
+            request = json.loads(line)
+            requestId = request.get("id")
+            handler = self.handlers.get(request["op"])
+            if handler is None:
+                raise ValueError(f"unknown op {request['op']}")
+            op = request["op"]
+            response = {"id": requestId, "ok": True, "result": handler(request)}
+        except Exception as e:
+            response = {"id": requestId, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        seconds = time.perf_counter() - start
+        response["ms"] = round(seconds * 1000, 3)
+        with self.lock:
+            latency = self.latency.setdefault(op, [0, 0.0, 0.0])
+            latency[0] = latency[0] + 1
+            latency[1] = latency[1] + seconds
+            latency[2] = max(latency[2], seconds)
+        return json.dumps(response)
+
+    def leafPorts(self, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        absolute leaf ports "instPath/port[msb:lsb]" of a bundle in a container,
+        in the order of LeafPortQuery.absoluteLeaves.
+        absolute paths are joined as strings, not added to instPathTable,
+        which would keep every path of every request for the life of the server
+        """
+        container: str = request["container"]
+        bundle: str = request["bundle"]
+        limit: int = request.get("limit", DEFAULT_LIMIT)
+        if container not in self.lgclView.nodes:
+            raise KeyError(f"no container {container}")
+        node = self.lgclView.nodes[container]
+        if node.portOf(bundle) is None or node.localOf(bundle) is None:
+            raise KeyError(f"no bundle {bundle} in {container}")
+        # paths from roots to the container, cached by the view
+        prefixes = [
+            path.join("/") for path in self.lgclView.iterOuter(HierInstPath(container, ()))
+        ]
+        ports = list[str]()
+        done = set[str]()
+        for instPath, leafNode in self.query.bundleLeaves(container, bundle):
+            msb, lsb = leafNode.range.msb, leafNode.range.lsb
+            bits = "" if msb == lsb else f"[{msb}:{lsb}]"
+            tail = "".join(f"/{inst}" for inst in instPath.instances)
+            tail = f"{tail}/{leafNode.name}{bits}"
+            for prefix in prefixes:
+                port = prefix + tail
+                if port in done:
+                    continue
+                if ports.__len__() == limit:
+                    return {"ports": ports, "truncated": True}
+                done.add(port)
+                ports.append(port)
+        return {"ports": ports, "truncated": False}
+
+    def instances(self, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        number of absolute instances of a module and the first limit of them
+        """
+        module: str = request["module"]
+        limit: int = request.get("limit", DEFAULT_LIMIT)
+        if module not in self.lgclView.nodes:
+            raise KeyError(f"no module {module}")
+        count = self.lgclView.countOf(module).occurrences
+        paths = list[str]()
+        for absPath in self.lgclView.iterOuter(HierInstPath(module, ())):
+            if paths.__len__() == limit:
+                break
+            paths.append(absPath.join("."))
+        return {"count": count, "paths": paths}
+
+    def translate(self, request: dict[str, Any]) -> str | None:
+        """
+        tile path of a logical path, or logical path of a tile path with toLogical,
+        None if not under a map line
+        """
+        return self.tileMap.translateStr(request["path"], not request.get("toLogical", False))
+
+    def stats(self, request: dict[str, Any]) -> dict[str, Any]:
+        with self.lock:
+            return {
+                op: {
+                    "requests": int(latency[0]),
+                    "meanMs": round(latency[1] / latency[0] * 1000, 3),
+                    "maxMs": round(latency[2] * 1000, 3),
+                }
+                for op, latency in self.latency.items()
+            }
+
+    def serve(
+        self, lines: Any, write: Callable[[str], None], pool: ThreadPoolExecutor, inFlight: int
+    ):
+        """
+        handle every line of lines in pool, write each response line once it is ready,
+        at most inFlight requests are pending, reading waits for a free slot.
+        return when all responses are written, raise the first error of writing
+        """
+        writeLock = threading.Lock()
+        slots = threading.BoundedSemaphore(inFlight)
+        errors = list[BaseException]()
+
+        def respond(line: str):
+            response = self.handle(line)
+            with writeLock:
+                write(response + "\n")
+
+        def done(future: Future):
+            # the future is not kept, only its error
+            error = future.exception()
+            if error is not None:
+                errors.append(error)
+            slots.release()
+
+        for line in lines:
+            if not line.strip():
+                continue
+            slots.acquire()
+            if errors.__len__() > 0:
+                slots.release()
+                break
+            pool.submit(respond, line).add_done_callback(done)
+        # wait for the pending requests
+        for _ in range(inFlight):
+            slots.acquire()
+        for _ in range(inFlight):
+            slots.release()
+        if errors.__len__() > 0:
+            raise errors[0]
+
+
+def serveSocket(
+    server: QueryServer, socketPath: str, pool: ThreadPoolExecutor, inFlight: int
+):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lines = (line.decode() for line in self.rfile)
+
+            def write(response: str):
+                self.wfile.write(response.encode())
+                self.wfile.flush()
+
+            server.serve(lines, write, pool, inFlight)
+
+    if os.path.exists(socketPath):
+        os.unlink(socketPath)
+    with socketserver.ThreadingUnixStreamServer(socketPath, Handler) as unixServer:
+        unixServer.daemon_threads = True
+        # stop serving on kill, shutdown waits for serve_forever so it runs in another thread
+        signal.signal(
+            signal.SIGTERM, lambda *_: threading.Thread(target=unixServer.shutdown).start()
+        )
+        try:
+            unixServer.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    os.unlink(socketPath)
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("lgclDir")
+    argParser.add_argument("tileDir")
+    argParser.add_argument("topName")
+    argParser.add_argument("--socket", help="serve on this unix socket instead of stdin/stdout")
+    argParser.add_argument("--threads", type=int, default=8, help="requests handled at once")
+    argParser.add_argument("--workers", type=int, default=1, help="processes parsing xml")
+    argParser.add_argument(
+        "--snapshot-dir", help="directory of design graph snapshots, reused if inputs are unchanged"
+    )
+    args = argParser.parse_args()
+    setupLogging()
+    lgclDir: str = args.lgclDir
+    tileDir: str = args.tileDir
+    topName: str = args.topName
+    snapshotDir: str | None = args.snapshot_dir
+
+    def buildPortView() -> LogicalTopoGraph:
+        lgclView = buildLgclView(lgclDir, topName)
+        lgclView.createPortTopo(lgclDir, workers=args.workers)
+        return lgclView
+
+    start = time.perf_counter()
+    lgclView = loadOrBuild(
+        None if snapshotDir is None else f"{snapshotDir}/logical_port.snapshot",
+        f"tops={topName}:xml={os.path.abspath(lgclDir)}",
+        buildPortView,
+        [f"{lgclDir}/logical_info.yml"],
+    )
+    tileView = loadOrBuild(
+        None if snapshotDir is None else f"{snapshotDir}/tile.snapshot",
+        f"tops={topName}:dir={os.path.abspath(tileDir)}",
+        lambda: buildTileView(tileDir, topName),
+        [f"{tileDir}/tile_info.yml"],
+    )
+    tileMap = LogicalTileMap(
+        f"{tileDir}/logical2tile_hierarchy.map", topName, lgclView, tileView, args.workers
+    )
+    server = QueryServer(lgclView, tileView, tileMap)
+    diag.flush()
+    if tileMap.mismatches.__len__() > 0:
+        print(tileMap.report(), file=sys.stderr)
+    print(f"loaded in {time.perf_counter() - start:.2f} s, serving", file=sys.stderr)
+
+    # requests read ahead of the pool, the rest wait in the socket or stdin
+    inFlight = args.threads * 4
+    with ThreadPoolExecutor(args.threads) as pool:
+        if args.socket is None:
+
+            def write(response: str):
+                sys.stdout.write(response)
+                sys.stdout.flush()
+
+            server.serve(sys.stdin, write, pool, inFlight)
+        else:
+            serveSocket(server, args.socket, pool, inFlight)
+    cl.info("request latency %s", json.dumps(server.stats({})))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+synthetic design database generator
+
+python3.10 -m benchmark.DesignGenerator outDir [--depth N] [--containers N] [--leaves N]
+    [--fanout N] [--reuse N] [--ports N] [--width N] [--local-fanout N] [--log-lines N]
+
+write to outDir
+logical_info.yml, tile_info.yml, <container>_port.xml, <container>_local_connect.xml,
+logical2tile_hierarchy.map and multidrive.txt, in the formats read by DesignTree
+"""
+
+from dataclasses import dataclass, fields
+from typing import TextIO
+import argparse
+import os
+import random
+
+
+@dataclass
+class DesignSpec:
+    """
+    depth: levels of instances below top, the last level is leaf blocks
+    containers: container modules of each level between top and leaves
+    leaves: leaf modules
+    fanout: sub instances of each container
+    reuse: sub modules of each container, its fanout instances cycle over them
+    ports: ports of each module, in bundles of 4
+    width: bus width of every third port, the others are 1 bit
+    localFanout: input ports driven by each local wire
+    multidrive: probability of a second output on a local wire
+    logLines: lines of multidrive log
+    """
+
+    depth: int = 4
+    containers: int = 4
+    leaves: int = 8
+    fanout: int = 4
+    reuse: int = 2
+    ports: int = 16
+    width: int = 32
+    localFanout: int = 2
+    multidrive: float = 0.05
+    logLines: int = 1000
+    seed: int = 1
+    top: str = "mpu"
+
+
+class DesignGenerator:
+    def __init__(self, spec: DesignSpec) -> None:
+        self.spec = spec
+        self.rnd = random.Random(spec.seed)
+        # level -> module names, level 0 is top
+        self.levels = [[spec.top]]
+        for level in range(1, spec.depth):
+            self.levels.append([f"c{level}_{k}" for k in range(spec.containers)])
+        self.levels.append([f"leaf{k}" for k in range(spec.leaves)])
+        # container -> [(instance name, sub module)]
+        self.children = dict[str, list[tuple[str, str]]]()
+        for level in range(spec.depth):
+            for module in self.levels[level]:
+                subs = self.levels[level + 1]
+                subs = self.rnd.sample(subs, min(spec.reuse, subs.__len__()))
+                self.children[module] = [
+                    (f"u{i}", subs[i % subs.__len__()]) for i in range(spec.fanout)
+                ]
+        self.containerNames = [m for level in self.levels[:-1] for m in level]
+        # containers instantiated under top, the log only reports them
+        self.reachable = [spec.top]
+        for container in self.reachable:
+            for _, sub in self.children.get(container, []):
+                if sub in self.children and sub not in self.reachable:
+                    self.reachable.append(sub)
+
+    def portWidth(self, k: int) -> int:
+        return self.spec.width if k % 3 == 0 else 1
+
+    def endBlock(self, inst: str, module: str, k: int) -> str:
+        signalDir, portDir = ("output", "transmit") if k % 2 == 0 else ("input", "receive")
+        return (
+            f'      <end_block block_inst_name="{inst}" block_class_name="{module}" '
+            f'port_name="{module}_b{k // 4}" port_signal_name="{module}_p{k}" '
+            f'port_signal_dir="{signalDir}" port_dir="{portDir}"/>\n'
+        )
+
+    def writeWire(self, file: TextIO, name: str, k: int, endBlocks: list[str]):
+        file.write(f'    <wire name="{name}" high_bit="{self.portWidth(k) - 1}" low_bit="0">\n')
+        file.write("".join(endBlocks))
+        file.write("    </wire>\n")
+
+    def writeContainer(self, outDir: str, container: str):
+        spec = self.spec
+        kids = self.children[container]
+        used = set[tuple[int, int]]()
+        with open(f"{outDir}/{container}_port.xml", "w", encoding="utf-8") as file:
+            file.write(f'<port container="{container}">\n')
+            for k in range(spec.ports):
+                if k % 4 == 0:
+                    file.write(f'  <bundle name="{container}_b{k // 4}">\n')
+                inst = k % kids.__len__()
+                used.add((inst, k))
+                endBlocks = [
+                    self.endBlock(container, container, k),
+                    self.endBlock(*kids[inst], k),
+                ]
+                if k == 1:
+                    # empty end blocks are common in real databases
+                    endBlocks.append(
+                        '      <end_block block_inst_name="" block_class_name="" port_name="" '
+                        'port_signal_name="" port_signal_dir="" port_dir=""/>\n'
+                    )
+                self.writeWire(file, f"{container}_p{k}", k, endBlocks)
+                if k % 4 == 3 or k == spec.ports - 1:
+                    file.write("  </bundle>\n")
+            file.write("</port>\n")
+
+        with open(f"{outDir}/{container}_local_connect.xml", "w", encoding="utf-8") as file:
+            file.write(f'<port container="{container}">\n')
+            wires = 0
+            for inst in range(kids.__len__()):
+                # output k drives input k + 3, which has the same width
+                for k in range(0, spec.ports - 3, 2):
+                    if (inst, k) in used:
+                        continue
+                    used.add((inst, k))
+                    endBlocks = [self.endBlock(*kids[inst], k)]
+                    for f in range(1, spec.localFanout + 1):
+                        sink = (inst + f) % kids.__len__()
+                        if (sink, k + 3) not in used:
+                            used.add((sink, k + 3))
+                            endBlocks.append(self.endBlock(*kids[sink], k + 3))
+                    if self.rnd.random() < spec.multidrive:
+                        driver = (inst + spec.localFanout + 1) % kids.__len__()
+                        if (driver, k) not in used:
+                            used.add((driver, k))
+                            endBlocks.append(self.endBlock(*kids[driver], k))
+                    if wires % 16 == 0:
+                        if wires > 0:
+                            file.write("  </bundle>\n")
+                        file.write(f'  <bundle name="{container}_lb{wires // 16}">\n')
+                    self.writeWire(file, f"{container}_l{wires}", k, endBlocks)
+                    wires = wires + 1
+            if wires > 0:
+                file.write("  </bundle>\n")
+            file.write("</port>\n")
+        return wires
+
+    def writeInfo(self, outDir: str):
+        with open(f"{outDir}/logical_info.yml", "w", encoding="utf-8") as file:
+            file.write("CONTAINER_CLASS_NAMES:\n")
+            for container in self.containerNames:
+                file.write(f"- {container}\n")
+            file.write("ALL_BLOCK_INSTANCE_PARENT_PATH:\n")
+            for container in self.containerNames:
+                for inst, sub in self.children[container]:
+                    file.write(f"- {container}.{inst}:{sub}\n")
+
+        # tile view: the same containers, tiles are the lowest level instead of leaf blocks
+        with open(f"{outDir}/tile_info.yml", "w", encoding="utf-8") as file:
+            file.write("ALL_AUTOGEN_BLOCK_CLASS_NAMES:\n")
+            for container in self.containerNames:
+                file.write(f"- {container}\n")
+            file.write("ALL_AUTOGEN_BLOCK_INSTANCE_PARENT_PATH:\n")
+            for level in self.levels[:-2]:
+                for container in level:
+                    for inst, sub in self.children[container]:
+                        file.write(f"- {container}.{inst}:{sub}\n")
+            file.write("TILE_CLASS_SUBBLOCK_NAMES:\n- tile\n")
+            if self.spec.depth > 1:
+                file.write("CTNR_CLASS_SUBBLOCK_NAMES:\n")
+                for inst, _ in self.children[self.spec.top]:
+                    file.write(f"- {self.spec.top}.{inst}\n")
+            else:
+                file.write("CTNR_CLASS_SUBBLOCK_NAMES: []\n")
+
+    def writeMap(self, outDir: str):
+        """
+        one line for every absolute instance, logical and tile paths are the same
+        """
+        with open(f"{outDir}/logical2tile_hierarchy.map", "w", encoding="utf-8") as file:
+            stack = [(self.spec.top, f"chip.{self.spec.top}")]
+            while stack.__len__() > 0:
+                module, path = stack.pop()
+                file.write(f"{path} -> {path}\n")
+                for inst, sub in reversed(self.children.get(module, [])):
+                    stack.append((sub, f"{path}.{inst}"))
+
+    def writeLog(self, outDir: str, localBundles: dict[str, int]):
+        spec = self.spec
+        with open(f"{outDir}/multidrive.txt", "w", encoding="utf-8") as file:
+            for _ in range(spec.logLines):
+                container = self.rnd.choice(self.reachable)
+                if localBundles[container] > 0 and self.rnd.random() < 0.5:
+                    bundle = f"{container}_lb{self.rnd.randrange(localBundles[container])}"
+                else:
+                    bundle = f"{container}_b{self.rnd.randrange((spec.ports + 3) // 4)}"
+                file.write(
+                    f"ERROR:  inst:{bundle}( blkclass:{container} hier:{container} "
+                    f'"u0:{container}_p0:transmit" "u1:{container}_p2:transmit"\n'
+                )
+
+    def write(self, outDir: str):
+        os.makedirs(outDir, exist_ok=True)
+        self.writeInfo(outDir)
+        localBundles = dict[str, int]()
+        for container in self.containerNames:
+            wires = self.writeContainer(outDir, container)
+            localBundles[container] = (wires + 15) // 16
+        self.writeMap(outDir)
+        self.writeLog(outDir, localBundles)
+
+
+def generateDesign(outDir: str, spec: DesignSpec):
+    DesignGenerator(spec).write(outDir)
+
+
+def addSpecArguments(argParser: argparse.ArgumentParser):
+    for specField in fields(DesignSpec):
+        option = "--" + "".join(
+            f"-{c.lower()}" if c.isupper() else c for c in specField.name
+        )
+        argParser.add_argument(
+            option, dest=specField.name, type=type(specField.default), default=specField.default
+        )
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("outDir")
+    addSpecArguments(argParser)
+    args = argParser.parse_args()
+    spec = DesignSpec(**{f.name: getattr(args, f.name) for f in fields(DesignSpec)})
+    generateDesign(args.outDir, spec)
+
+
+if __name__ == "__main__":
+    main()
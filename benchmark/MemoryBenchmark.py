@@ -0,0 +1,204 @@
+"""
+memory benchmark of the port topology data model on a generated design
+
+python3.10 -m benchmark.MemoryBenchmark [--containers N] [--instances N] [--wires N] [--fanout N]
+
+print
+1. memory of the whole port topology and count of each kind of object
+2. bytes per object of each class, compared with the same attributes in a __dict__ object
+3. how many name strings are shared by interning
+"""
+
+from DesignTree.DesignTopoGraph import DesignTopoGraph, InstParentPath
+from DesignTree.PortXml import PortXmlParser, BundleRecord, EndBlockRecord, WireRecord
+from DesignTree.PortXml import BundleConnec, EndBlock, WireConnec
+from DesignTree.Node import ModuleNode, NetNode, PortWireNode, WireLink
+from typing import Callable
+import argparse
+import gc
+import tracemalloc
+
+LEAF_KINDS = 8
+BUNDLE_WIDTH = 16
+
+
+def width(port: int) -> int:
+    return 32 if port % 4 == 0 else 1
+
+
+def generateRecords(
+    container: str, instances: int, wires: int, fanout: int
+) -> tuple[list[BundleRecord], list[BundleRecord]]:
+    """
+    port.xml: container port p<w> <- u<w % instances>.o<w // instances>
+    local_connect.xml: u<w % instances>.lo<j> -> u<w % instances + f>.li<j>_<f>, f in 1..fanout
+    """
+
+    def endBlock(
+        inst: str, module: str, port: str, dir: str, bundle: str = ""
+    ) -> EndBlockRecord:
+        portDir = "transmit" if dir == "output" else "receive"
+        return (inst, module, bundle or f"{port}_b", port, dir, portDir)
+
+    def leaf(idx: int) -> str:
+        return f"leaf{idx % LEAF_KINDS}"
+
+    portWires = list[WireRecord]()
+    localWires = list[WireRecord]()
+    for w in range(wires):
+        inst, j = w % instances, w // instances
+        portWires.append(
+            (
+                f"{container}_p{w}",
+                width(j) - 1,
+                0,
+                [
+                    endBlock(
+                        container,
+                        container,
+                        f"{container}_p{w}",
+                        "output",
+                        f"{container}_b{w // BUNDLE_WIDTH}",
+                    ),
+                    endBlock(f"u{inst}", leaf(inst), f"o{j}", "output"),
+                ],
+            )
+        )
+        ends = [endBlock(f"u{inst}", leaf(inst), f"lo{j}", "output")]
+        for f in range(1, fanout + 1):
+            sink = (inst + f) % instances
+            ends.append(endBlock(f"u{sink}", leaf(sink), f"li{j}_{f}", "input"))
+        localWires.append((f"{container}_l{w}", width(j) - 1, 0, ends))
+
+    def bundles(prefix: str, wireList: list[WireRecord]) -> list[BundleRecord]:
+        return [
+            (f"{prefix}{b}", wireList[b * BUNDLE_WIDTH : (b + 1) * BUNDLE_WIDTH])
+            for b in range((wireList.__len__() + BUNDLE_WIDTH - 1) // BUNDLE_WIDTH)
+        ]
+
+    return (bundles(f"{container}_b", portWires), bundles(f"{container}_lb", localWires))
+
+
+def buildDesign(containers: int, instances: int, wires: int, fanout: int):
+    graph = DesignTopoGraph()
+    names = [f"ctr{c}" for c in range(containers)]
+    paths = [
+        InstParentPath(name, f"u{i}", f"leaf{i % LEAF_KINDS}")
+        for name in names
+        for i in range(instances)
+    ]
+    graph.createModuleHier(names, paths)
+    parsers = list[PortXmlParser]()
+    for name in names:
+        portRecords, localRecords = generateRecords(name, instances, wires, fanout)
+        portXml = PortXmlParser.fromRecords(portRecords, name)
+        localConnect = PortXmlParser.fromRecords(localRecords, name)
+        graph.nodes[name].loadPortXml(portXml)
+        graph.nodes[name].loadLocalConnec(localConnect)
+        parsers.extend((portXml, localConnect))
+    return graph, parsers
+
+
+def measure(factory: Callable[[int], object], count: int) -> float:
+    """
+    average bytes of count objects made by factory
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    # exclude the list holding the objects
+    return (after - before) / count - 8
+
+
+class DictObject:
+    """
+    the same attributes stored in __dict__, as the data model without __slots__
+    """
+
+    def __init__(self, names: tuple[str, ...], values: tuple) -> None:
+        for name, value in zip(names, values):
+            setattr(self, name, value)
+
+
+def perObject(samples: dict[str, object], count: int):
+    print(f"{'class':<14}{'slots':>10}{'__dict__':>10}  bytes/object")
+    for className, sample in samples.items():
+        names: tuple[str, ...] = type(sample).__slots__  # type: ignore
+        values = tuple(getattr(sample, name) for name in names)
+        slotted = measure(lambda i: copyOf(sample), count)
+        plain = measure(lambda i: DictObject(names, values), count)
+        print(f"{className:<14}{slotted:>10.1f}{plain:>10.1f}")
+
+
+def copyOf(sample: object) -> object:
+    obj = object.__new__(type(sample))
+    for name in type(sample).__slots__:  # type: ignore
+        object.__setattr__(obj, name, getattr(sample, name))
+    return obj
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--containers", type=int, default=200)
+    argParser.add_argument("--instances", type=int, default=16)
+    argParser.add_argument("--wires", type=int, default=256)
+    argParser.add_argument("--fanout", type=int, default=4)
+    args = argParser.parse_args()
+
+    gc.collect()
+    tracemalloc.start()
+    graph, parsers = buildDesign(args.containers, args.instances, args.wires, args.fanout)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    bundles = [b for p in parsers for b in p.bundleDict.values()]
+    wires = [w for b in bundles for w in b.wires.values()]
+    endBlocks = [e for w in wires for e in w.endBlocks]
+    modules = list(graph.nodes.values())
+    ports = [p for m in modules for p in m.ports.values()]
+    links = [l for p in ports for l in list(p.inner) + list(p.outer)]
+    nets = [n for m in modules for n in m.local.values()]
+    print(f"design: {args}")
+    print(f"memory: current {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB")
+    counts = {
+        "BundleConnec": bundles.__len__(),
+        "WireConnec": wires.__len__(),
+        "EndBlock": endBlocks.__len__(),
+        "ModuleNode": modules.__len__(),
+        "PortWireNode": ports.__len__(),
+        "WireLink": links.__len__(),
+        "NetNode": nets.__len__(),
+    }
+    for className, count in counts.items():
+        print(f"  {className:<14}{count:>12}")
+    print()
+
+    samples: dict[str, object] = {
+        BundleConnec.__name__: bundles[0],
+        WireConnec.__name__: wires[0],
+        EndBlock.__name__: endBlocks[0],
+        ModuleNode.__name__: modules[0],
+        PortWireNode.__name__: ports[0],
+        WireLink.__name__: links[0],
+        NetNode.__name__: nets[0],
+    }
+    perObject(samples, 100000)
+    print()
+
+    names = [
+        n
+        for e in endBlocks
+        for n in (e.instName, e.moduleName, e.portBundleName, e.portWireName)
+    ]
+    nameObjects = {id(n) for n in names}
+    rangeObjects = {id(w.range) for w in wires}
+    print(f"end block names: {names.__len__()} references, {nameObjects.__len__()} strings")
+    print(f"wire ranges: {wires.__len__()} wires, {rangeObjects.__len__()} WireRange objects")
+
+
+if __name__ == "__main__":
+    main()
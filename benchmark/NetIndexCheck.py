@@ -0,0 +1,103 @@
+"""
+check NetIndex.netOf against a brute-force walk on a generated design
+
+python3.10 -m benchmark.NetIndexCheck [design spec options of benchmark.DesignGenerator]
+
+every port of every absolute instance is joined with the ports linked to it by
+port.inner and by the nets of local wires, the connected ports must have the same
+netOf, the others different ones, and a port without any connection has no net
+"""
+
+from benchmark.DesignGenerator import DesignGenerator, DesignSpec, addSpecArguments
+from benchmark.ReloadCheck import build
+from DesignTree import HierInstPath, NetIndex, NetId
+from DesignTree.DesignTopoGraph import DesignTopoGraph
+from dataclasses import fields
+import argparse
+import sys
+import tempfile
+
+# (absolute instance path, port name)
+AbsPort = tuple[HierInstPath, str]
+
+
+def bruteNets(graph: DesignTopoGraph, top: str) -> dict[AbsPort, AbsPort]:
+    """
+    absolute port -> the first port of its connected ports, by union-find
+    """
+    parent = dict[AbsPort, AbsPort]()
+
+    def find(key: AbsPort) -> AbsPort:
+        root = parent.setdefault(key, key)
+        while parent[root] != root:
+            root = parent[root]
+        parent[key] = root
+        return root
+
+    def union(lhs: AbsPort, rhs: AbsPort):
+        lhsRoot, rhsRoot = find(lhs), find(rhs)
+        if lhsRoot != rhsRoot:
+            parent[lhsRoot] = rhsRoot
+
+    stack = [HierInstPath(top, ())]
+    while stack.__len__() > 0:
+        instPath = stack.pop()
+        node = graph.nodes[top]
+        for inst in instPath.instances:
+            node = node.next[inst]
+        for name, port in node.ports.items():
+            find((instPath, name))
+            for link, innerPort in port.inner.items():
+                union((instPath, name), (instPath.addInst(link.thatInst), innerPort.name))
+        for net in node.local.values():
+            keys = [(instPath.addInst(inst), port.name) for inst, port in net.members]
+            for key in keys:
+                union(keys[0], key)
+        stack.extend(instPath.addInst(inst) for inst in node.next.keys())
+    return {key: find(key) for key in parent}
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    addSpecArguments(argParser)
+    args = argParser.parse_args()
+    spec = DesignSpec(**{f.name: getattr(args, f.name) for f in fields(DesignSpec)})
+
+    with tempfile.TemporaryDirectory() as designDir:
+        DesignGenerator(spec).write(designDir)
+        graph = build(designDir, spec.top)
+    brute = bruteNets(graph, spec.top)
+    sizes = dict[AbsPort, int]()
+    for root in brute.values():
+        sizes[root] = sizes.get(root, 0) + 1
+    netIndex = NetIndex(graph)
+
+    errors = list[str]()
+    rootOfNet = dict[NetId, AbsPort]()
+    for (instPath, name), root in brute.items():
+        netId = netIndex.netOf(instPath, name)
+        where = f"{instPath.join('/')} {name}"
+        if netId is None:
+            if sizes[root] > 1:
+                errors.append(f"{where}: no net, connected to {sizes[root] - 1} ports")
+            continue
+        other = rootOfNet.setdefault(netId, root)
+        if other != root:
+            errors.append(f"{where}: same net as unconnected {other[0].join('/')} {other[1]}")
+    netsOfRoot = dict[AbsPort, set[NetId | None]]()
+    for (instPath, name), root in brute.items():
+        netsOfRoot.setdefault(root, set()).add(netIndex.netOf(instPath, name))
+    for root, nets in netsOfRoot.items():
+        if sizes[root] > 1 and nets.__len__() > 1:
+            errors.append(f"{root[0].join('/')} {root[1]}: connected ports in {nets.__len__()} nets")
+
+    connected = sum(1 for root in brute.values() if sizes[root] > 1)
+    print(f"{brute.__len__()} ports, {connected} connected, {errors.__len__()} errors")
+    for error in errors[:10]:
+        print(error)
+    if errors.__len__() > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
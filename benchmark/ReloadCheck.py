@@ -0,0 +1,105 @@
+"""
+check DesignTopoGraph.reloadPortTopo against a fresh build on a generated design
+
+python3.10 -m benchmark.ReloadCheck [design spec options of benchmark.DesignGenerator]
+
+a port of a sub container is removed from its port.xml,
+and every wire of the parent linking to the port is removed too,
+so the parent and the child both change. the reloaded graph must be the same as
+a graph built from the changed files, whichever container is unloaded first
+(the order of a set, run with several PYTHONHASHSEED values to cover both)
+"""
+
+from benchmark.DesignGenerator import DesignGenerator, DesignSpec, addSpecArguments
+from DesignTree import LogicalTopoGraph
+from DesignTree.DesignTopoGraph import DesignTopoGraph
+from dataclasses import fields
+from xml.etree import ElementTree as ET
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+def build(designDir: str, top: str) -> LogicalTopoGraph:
+    graph = LogicalTopoGraph(f"{designDir}/logical_info.yml")
+    assert graph.tops({top}) == {top}
+    graph.createPortTopo(designDir)
+    return graph
+
+
+def signature(graph: DesignTopoGraph) -> set[tuple]:
+    """
+    modules, ports, port links and local nets of the graph, comparable between graphs
+    """
+    res = set[tuple]()
+    for node in graph.nodes.values():
+        for portName, port in node.ports.items():
+            res.add(("port", node.name, portName, port.dir, port.range.msb, port.range.lsb))
+            for link, other in port.inner.items():
+                assert other.module is not None
+                res.add(("inner", node.name, portName, link, other.module.name, other.name))
+            for link, other in port.outer.items():
+                assert other.module is not None
+                res.add(("outer", node.name, portName, link, other.module.name, other.name))
+        for wire, net in node.local.items():
+            members = tuple((inst, port.name) for inst, port in net.members)
+            res.add(("local", node.name, wire, net.bundle, members))
+        for bundle, wires in node.bundle2wire.items():
+            res.add(("bundle", node.name, bundle, frozenset(wires)))
+    return res
+
+
+def removeWires(xmlFile: str, module: str, portName: str):
+    """
+    remove wires with an end block on portName of module
+    """
+    tree = ET.parse(xmlFile)
+    for bundle in tree.getroot():
+        for wire in list(bundle):
+            for endBlock in wire:
+                if (
+                    endBlock.get("block_class_name") == module
+                    and endBlock.get("port_signal_name") == portName
+                ):
+                    bundle.remove(wire)
+                    break
+    tree.write(xmlFile)
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    addSpecArguments(argParser)
+    args = argParser.parse_args()
+    spec = DesignSpec(**{f.name: getattr(args, f.name) for f in fields(DesignSpec)})
+    assert spec.depth >= 3, "the child of top must be a container"
+
+    generator = DesignGenerator(spec)
+    parent = spec.top
+    child = generator.children[parent][0][1]
+    portName = f"{child}_p0"
+    with tempfile.TemporaryDirectory() as designDir:
+        generator.write(designDir)
+        graph = build(designDir, spec.top)
+        assert portName in graph.nodes[child].ports
+        # mtime must differ from the stamps taken while loading
+        time.sleep(0.01)
+        removeWires(f"{designDir}/{child}_port.xml", child, portName)
+        for suffix in ("port", "local_connect"):
+            removeWires(f"{designDir}/{parent}_{suffix}.xml", child, portName)
+
+        changed = graph.reloadPortTopo()
+        fresh = build(designDir, spec.top)
+        expect, got = signature(fresh), signature(graph)
+
+    print(f"reloaded {sorted(changed)}")
+    if changed != {parent, child} or expect != got:
+        print(f"missing: {sorted(map(str, expect - got))[:5]}")
+        print(f"stale: {sorted(map(str, got - expect))[:5]}")
+        sys.exit(1)
+    print(f"same as fresh build, PYTHONHASHSEED={os.environ.get('PYTHONHASHSEED')}")
+
+
+if __name__ == "__main__":
+    main()
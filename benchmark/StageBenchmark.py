@@ -0,0 +1,156 @@
+"""
+time and memory of each DesignTree stage on generated designs of growing size
+
+python3.10 -m benchmark.StageBenchmark [--sweep fanout=2,4,8] [--memory] [--json file]
+    [design spec options of benchmark.DesignGenerator]
+
+for each value of the swept spec field, a design is generated to a temporary directory,
+then every stage is run in order and measured:
+yaml, hierarchy, tops, portTopo, tileView, tileMap, leafQuery, multiDrive
+--memory: trace allocations of each stage by tracemalloc, it makes stages slower
+the table shows these stages, --json also has the inner stages of DesignTree.Stats
+"""
+
+from benchmark.DesignGenerator import DesignSpec, addSpecArguments, generateDesign
+from DesignTree import LogicalTopoGraph, TileTopoGraph, LogicalTileMap, LeafPortQuery
+from DesignTree import MultiDriveChecker, NetIndex, stats
+from DesignTree.DesignTopoGraph import DesignTopoGraph, InstParentPath
+from DesignTree.InfoYaml import loadInfoLists
+from DesignTree.Stats import StageRecord
+from MultiDriverTracer import InputParser, LeafPortWriter
+from dataclasses import asdict, fields, replace
+from typing import Any, Callable
+import argparse
+import json
+import os
+import tempfile
+
+
+def measure(stage: str, run: Callable[[], int]) -> StageRecord:
+    with stats.stage(stage) as record:
+        record.items = run()
+    return record
+
+
+def runStages(designDir: str, spec: DesignSpec) -> list[StageRecord]:
+    top = spec.top
+    # objects passed between stages
+    state = dict[str, Any]()
+
+    def yamlStage():
+        state["info"], _ = loadInfoLists(
+            f"{designDir}/logical_info.yml",
+            {
+                "CONTAINER_CLASS_NAMES": str.strip,
+                "ALL_BLOCK_INSTANCE_PARENT_PATH": InstParentPath.fromStr,
+            },
+        )
+        return state["info"]["ALL_BLOCK_INSTANCE_PARENT_PATH"].__len__()
+
+    def hierarchyStage():
+        graph = LogicalTopoGraph.__new__(LogicalTopoGraph)
+        DesignTopoGraph.__init__(graph)
+        info = state.pop("info")
+        graph.createModuleHier(
+            info["CONTAINER_CLASS_NAMES"], info["ALL_BLOCK_INSTANCE_PARENT_PATH"]
+        )
+        state["graph"] = graph
+        return graph.allNodes.__len__()
+
+    def topsStage():
+        graph: LogicalTopoGraph = state["graph"]
+        assert graph.tops({top}) == {top}
+        return graph.nodes.__len__()
+
+    def portTopoStage():
+        graph: LogicalTopoGraph = state["graph"]
+        graph.createPortTopo(designDir)
+        return sum(node.ports.__len__() for node in graph.nodes.values())
+
+    def tileViewStage():
+        tileView = TileTopoGraph(f"{designDir}/tile_info.yml")
+        assert tileView.tops({top}) == {top}
+        state["tileView"] = tileView
+        return tileView.nodes.__len__()
+
+    def tileMapStage():
+        tileMap = LogicalTileMap(
+            f"{designDir}/logical2tile_hierarchy.map", top, state["graph"], state["tileView"]
+        )
+        return sum(lines.__len__() for lines in tileMap.moduleMap.values())
+
+    def leafQueryStage():
+        query = LeafPortQuery(state["graph"])
+        records = InputParser(f"{designDir}/multidrive.txt").records()
+        requests = ((container, bundle) for container, bundle, _ in records)
+        writer = LeafPortWriter(os.devnull)
+        count = 0
+        for absPath, leafNode in query.absoluteLeaves(requests):
+            writer.write(absPath, leafNode)
+            count = count + 1
+        writer.close()
+        return count
+
+    def multiDriveStage():
+        checker = MultiDriveChecker(NetIndex(state["graph"]))
+        return checker.check().__len__()
+
+    stages: list[tuple[str, Callable[[], int]]] = [
+        ("yaml", yamlStage),
+        ("hierarchy", hierarchyStage),
+        ("tops", topsStage),
+        ("portTopo", portTopoStage),
+        ("tileView", tileViewStage),
+        ("tileMap", tileMapStage),
+        ("leafQuery", leafQueryStage),
+        ("multiDrive", multiDriveStage),
+    ]
+    return [measure(stage, run) for stage, run in stages]
+
+
+def printResults(title: str, results: list[StageRecord]):
+    print(title)
+    print(
+        f"  {'stage':<12}{'wall s':>10}{'cpu s':>10}{'alloc MB':>10}{'peak MB':>10}"
+        f"{'rss MB':>10}{'items':>12}"
+    )
+    for r in results:
+        alloc = "-" if r.allocated is None else f"{r.allocated / 2**20:.1f}"
+        peak = "-" if r.peak is None else f"{r.peak / 2**20:.1f}"
+        print(
+            f"  {r.name:<12}{r.wall:>10.3f}{r.cpu:>10.3f}{alloc:>10}{peak:>10}"
+            f"{r.maxRss / 2**20:>10.1f}{r.items:>12}"
+        )
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "--sweep", default="fanout=2,4,8", help="spec field and its values, like fanout=2,4,8"
+    )
+    argParser.add_argument("--memory", action="store_true", help="trace memory by tracemalloc")
+    argParser.add_argument("--json", help="write results of all sizes to this file")
+    addSpecArguments(argParser)
+    args = argParser.parse_args()
+    base = DesignSpec(**{f.name: getattr(args, f.name) for f in fields(DesignSpec)})
+
+    sweepField, _, values = args.sweep.partition("=")
+    fieldType = type(getattr(base, sweepField))
+    report = list[dict[str, Any]]()
+    stats.enable(args.memory)
+    for value in values.split(","):
+        spec = replace(base, **{sweepField: fieldType(value)})
+        stats.reset()
+        with tempfile.TemporaryDirectory() as designDir:
+            generateDesign(designDir, spec)
+            results = runStages(designDir, spec)
+        printResults(f"{sweepField}={value}", results)
+        report.append({"spec": asdict(spec), **stats.report()})
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
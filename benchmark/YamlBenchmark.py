@@ -0,0 +1,103 @@
+"""
+benchmark of loading logical_info.yml on a generated file
+
+python3.10 -m benchmark.YamlBenchmark [--entries N] [--skip-pure] [--file path]
+
+compare
+1. yaml.safe_load, the pure python loader
+2. yaml.load with the C loader
+3. loadInfoLists, the line scanner used by LogicalTopoGraph
+"""
+
+from DesignTree.DesignTopoGraph import InstParentPath
+from DesignTree.InfoYaml import YamlLoader, loadInfoLists
+from typing import Callable
+import argparse
+import os
+import tempfile
+import time
+import yaml
+
+CONTAINER_FANOUT = 8
+# keys not used by LogicalTopoGraph, skipped by the scanner
+UNUSED_KEYS = 4
+
+
+def generate(yamlFile: str, entries: int):
+    """
+    a tree of containers with CONTAINER_FANOUT sub containers,
+    the last level instantiates leaf blocks until there are entries instance parent paths
+    """
+    containers = entries // (CONTAINER_FANOUT * 4) + 1
+    with open(yamlFile, "w", encoding="utf-8") as file:
+        file.write("CONTAINER_CLASS_NAMES:\n")
+        for c in range(containers):
+            file.write(f"- ctr{c}\n")
+        for k in range(UNUSED_KEYS):
+            file.write(f"UNUSED_KEY_{k}:\n")
+            for c in range(containers):
+                file.write(f"  ctr{c}: {{tile: t{c % 97}, group: g{k}}}\n")
+        file.write("ALL_BLOCK_INSTANCE_PARENT_PATH:\n")
+        written = 0
+        for c in range(1, containers):
+            file.write(f"- ctr{(c - 1) // CONTAINER_FANOUT}.u{c}:ctr{c}\n")
+            written = written + 1
+        leaf = 0
+        while written < entries:
+            file.write(f"- ctr{leaf % containers}.l{leaf}:leaf{leaf % 512}\n")
+            leaf = leaf + 1
+            written = written + 1
+
+
+def pureLoad(yamlFile: str):
+    with open(yamlFile, "r", encoding="utf-8") as file:
+        data = yaml.safe_load(file)
+    return [InstParentPath.fromStr(x) for x in data["ALL_BLOCK_INSTANCE_PARENT_PATH"]]
+
+
+def cLoad(yamlFile: str):
+    with open(yamlFile, "r", encoding="utf-8") as file:
+        data = yaml.load(file, Loader=YamlLoader)
+    return [InstParentPath.fromStr(x) for x in data["ALL_BLOCK_INSTANCE_PARENT_PATH"]]
+
+
+def scanLoad(yamlFile: str):
+    data, _ = loadInfoLists(
+        yamlFile,
+        {
+            "CONTAINER_CLASS_NAMES": str.strip,
+            "ALL_BLOCK_INSTANCE_PARENT_PATH": InstParentPath.fromStr,
+        },
+    )
+    return data["ALL_BLOCK_INSTANCE_PARENT_PATH"]
+
+
+def timeIt(name: str, load: Callable[[str], list], yamlFile: str, expect: list | None):
+    start = time.perf_counter()
+    res = load(yamlFile)
+    cost = time.perf_counter() - start
+    same = "" if expect is None else ("same" if res == expect else "DIFFERENT")
+    print(f"{name:<12}{cost:>10.2f} s  {same}")
+    return res
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--entries", type=int, default=2000000)
+    argParser.add_argument("--skip-pure", action="store_true", help="skip yaml.safe_load")
+    argParser.add_argument("--file", help="keep the generated file here")
+    args = argParser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        yamlFile = args.file or f"{tmpDir}/logical_info.yml"
+        generate(yamlFile, args.entries)
+        print(f"{yamlFile}: {args.entries} entries, {os.path.getsize(yamlFile) / 2**20:.1f} MB")
+        print(f"C loader: {YamlLoader.__name__}")
+        expect = timeIt("scan", scanLoad, yamlFile, None)
+        timeIt("C loader", cLoad, yamlFile, expect)
+        if not args.skip_pure:
+            timeIt("safe_load", pureLoad, yamlFile, expect)
+
+
+if __name__ == "__main__":
+    main()